@@ -2,11 +2,20 @@
 import uuid
 import os
 import json
-from typing import Dict, Any, Optional
+import math
+import time
+import asyncio
+from typing import Dict, Any, Optional, Set
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from app.models.video import VideoGenerationRequest
-from app.services.video_generator import create_personalized_video
+from app.models.video import VideoGenerationRequest, BatchVideoGenerationRequest
+from app.services.workspace import workspace_manager
+from app.services import processes
+from app.services.admission import admission_controller
+from app.services.checkpoint import TaskManifest, claim, release_claim, find_resumable
+from app.core.config import settings
+from app.core import tracing
+from app.core.metrics import QUEUE_DEPTH, JOBS_IN_FLIGHT, JOBS_TOTAL, ADMISSION_REJECTIONS, record_failure
 
 # Redis client (optional). We'll lazily import to avoid hard dependency for local runs.
 REDIS_URL = os.environ.get("REDIS_URL")  # e.g. "redis://:password@hostname:6379/0"
@@ -49,28 +58,237 @@ def _redis_get(task_id: str) -> Optional[dict]:
     else:
         return TASK_CACHE.get(task_id)
 
+# Jobs running in this process, by task_id (or batch_id), so DELETE /tasks/{id} can cancel them
+RUNNING_JOBS: Dict[str, asyncio.Task] = {}
+# Jobs the API was asked to cancel (as opposed to the server itself shutting down)
+# (job_id -> when). Runners forget their own entry when they finish; entries for jobs that never ran
+# here (e.g. running on another replica) expire after CANCEL_REQUEST_TTL_SECONDS.
+CANCEL_REQUESTED: Dict[str, float] = {}
+CANCEL_REQUEST_TTL_SECONDS = 3600
+
+TERMINAL_STATUSES = {"COMPLETE", "FAILED", "PARTIAL", "CANCELLED", "TIMED_OUT"}
+
+
+def _request_cancel(job_id: str):
+    now = time.time()
+    for stale in [j for j, requested_at in CANCEL_REQUESTED.items() if now - requested_at > CANCEL_REQUEST_TTL_SECONDS]:
+        del CANCEL_REQUESTED[stale]
+    CANCEL_REQUESTED[job_id] = now
+    if redis_client:
+        # Lets the replica actually running the job notice, even if this request landed elsewhere
+        redis_client.set(f"cancel:{job_id}", "1", ex=86400)
+
+
+def _cancel_requested(job_id: str) -> bool:
+    if job_id in CANCEL_REQUESTED:
+        return True
+    if redis_client:
+        try:
+            return bool(redis_client.exists(f"cancel:{job_id}"))
+        except Exception:
+            return False
+    return False
+
+
+async def _watch_for_remote_cancel(job_id: str, job: asyncio.Task):
+    while not job.done():
+        await asyncio.sleep(settings.CANCEL_POLL_SECONDS)
+        if await asyncio.to_thread(_cancel_requested, job_id):
+            CANCEL_REQUESTED[job_id] = time.time()
+            job.cancel()
+            return
+
+
+async def _run_supervised(job_id: str, coro, deadline_seconds: float):
+    """
+    Runs a pipeline coroutine as a cancellable job with a deadline.
+    Returns (outcome, result) where outcome is "DONE", "CANCELLED" or "TIMED_OUT". When the job is
+    cancelled or runs out of time, its asyncio tasks are cancelled (abandoning in-flight provider calls)
+    and its manim/ffmpeg child processes are killed.
+    """
+    async def bound():
+        processes.bind_job(job_id)
+        return await coro
+
+    job = asyncio.create_task(bound())
+    RUNNING_JOBS[job_id] = job
+    watcher = asyncio.create_task(_watch_for_remote_cancel(job_id, job)) if redis_client else None
+    outcome, result = "DONE", None
+    try:
+        result = await asyncio.wait_for(job, timeout=deadline_seconds)
+    except asyncio.TimeoutError:
+        outcome = "TIMED_OUT"
+    except asyncio.CancelledError:
+        if job_id not in CANCEL_REQUESTED:
+            # We're being cancelled ourselves (e.g. shutdown): still don't leave children behind
+            processes.cancel_job(job_id)
+            raise
+        outcome = "CANCELLED"
+    finally:
+        RUNNING_JOBS.pop(job_id, None)
+        if watcher:
+            watcher.cancel()
+
+    if outcome == "DONE":
+        processes.forget_job(job_id)
+    else:
+        processes.cancel_job(job_id)
+        print(f"--- Job {job_id} stopped: {outcome} ---")
+    return outcome, result
+
+
+async def _wait_for_slot(job_id: str) -> bool:
+    """Waits in the admission queue. Returns False if the job was cancelled before it got a render slot."""
+    granted = False
+    try:
+        if not _cancel_requested(job_id):
+            granted = await admission_controller.acquire(job_id)
+        # It may have been cancelled on another replica while it waited
+        granted = granted and not _cancel_requested(job_id)
+    finally:
+        QUEUE_DEPTH.dec()
+    if not granted:
+        admission_controller.release(job_id)
+    return granted
+
+
+def _reject_if_full(job_id: str, quality: str, endpoint: str, cost: float = 1.0, slots: int = 1):
+    """Reserves a queue place, or raises 429. The caller must release() it if it then fails to schedule the job."""
+    retry_after = admission_controller.admit(job_id, quality, cost, slots)
+    if retry_after is not None:
+        ADMISSION_REJECTIONS.inc(endpoint=endpoint)
+        print(f"[Admission] At capacity; rejecting {endpoint} (retry after {retry_after}s)")
+        raise HTTPException(
+            status_code=429,
+            detail=f"The server is busy rendering other videos. Please retry in about {retry_after} seconds.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+def _abandon_task(task_id: str, outcome: str, deadline_seconds: float = None, batch_id: str = None):
+    """Records CANCELLED/TIMED_OUT for a task and throws its workspace away."""
+    if outcome == "TIMED_OUT":
+        message = f"Video generation did not finish within {deadline_seconds:.0f} seconds and was stopped."
+        record_failure("pipeline", "deadline_exceeded")
+    else:
+        message = "Video generation was cancelled."
+    payload = {"status": outcome, "message": message}
+    if batch_id:
+        payload["batch_id"] = batch_id
+    _redis_set(task_id, payload, expire_seconds=3600)
+    JOBS_TOTAL.inc(status=outcome)
+    workspace_manager.discard(task_id)
+
+
 async def run_video_generation_pipeline(task_id: str, request: VideoGenerationRequest):
     """
     Async background function that runs the async generator and updates persistent store.
     FastAPI's BackgroundTasks will await async callables as background tasks.
     """
     print(f"--- Background task started (task_id={task_id}) ---")
-    _redis_set(task_id, {"status": "IN_PROGRESS", "message": "Video generation started..."}, expire_seconds=3600)
+    if not await _wait_for_slot(task_id):
+        # Cancelled before it got a chance to start
+        try:
+            _abandon_task(task_id, "CANCELLED")
+        finally:
+            CANCEL_REQUESTED.pop(task_id, None)
+            release_claim(task_id)
+        return
 
+    async def publish_preview(preview_url: str):
+        _redis_set(task_id, {"status": "PREVIEW_READY", "preview_url": preview_url, "message": f"Preview is ready. Rendering {request.quality} quality..."}, expire_seconds=3600)
+
+    deadline_seconds = request.deadline_seconds or settings.JOB_DEADLINE_SECONDS
+    # The job holds a render slot from here on: anything that can fail (even a status write) goes
+    # inside the try, so the finally always gives the slot back
+    JOBS_IN_FLIGHT.inc()
+    # Set once the job has a final status; a job cut off by shutdown has none and stays resumable
+    terminal_status = None
     try:
+        _redis_set(task_id, {"status": "IN_PROGRESS", "message": "Video generation started..."}, expire_seconds=3600)
+
+        # Imported here so the API process only loads Gemini/Manim/MoviePy/ElevenLabs once it actually renders
+        from app.services.video_generator import create_personalized_video
+
         # Await the async generator instead of using asyncio.run
-        final_video_url = await create_personalized_video(request)
+        outcome, final_video_url = await _run_supervised(
+            task_id,
+            create_personalized_video(request, on_preview=publish_preview, task_id=task_id),
+            deadline_seconds
+        )
 
-        if final_video_url and "R2 Upload Successful: Missing" not in final_video_url:
+        if outcome != "DONE":
+            terminal_status = outcome
+            _abandon_task(task_id, outcome, deadline_seconds)
+        elif final_video_url and "R2 Upload Successful: Missing" not in final_video_url:
+            terminal_status = "COMPLETE"
             print(f"--- Background task finished successfully. Final video at: {final_video_url} ---")
             _redis_set(task_id, {"status": "COMPLETE", "url": final_video_url, "message": "Video is ready."}, expire_seconds=86400)
+            JOBS_TOTAL.inc(status="COMPLETE")
+            trace = tracing.get_trace(task_id)
+            if trace is not None:
+                admission_controller.record(request.quality, trace.stage_totals())
         else:
+            terminal_status = "FAILED"
             print("--- Background task finished with an error. ---")
             _redis_set(task_id, {"status": "FAILED", "message": final_video_url or "A critical error occurred."}, expire_seconds=3600)
+            JOBS_TOTAL.inc(status="FAILED")
 
     except Exception as e:
+        terminal_status = "FAILED"
         print(f"--- Background task failed with an unhandled exception: {e} ---")
+        record_failure("pipeline", e)
         _redis_set(task_id, {"status": "FAILED", "message": f"An unhandled exception occurred: {e}"}, expire_seconds=3600)
+        JOBS_TOTAL.inc(status="FAILED")
+    finally:
+        JOBS_IN_FLIGHT.dec()
+        admission_controller.release(task_id)
+        CANCEL_REQUESTED.pop(task_id, None)
+        if terminal_status is not None:
+            # The pipeline normally releases its own workspace, but not if it never ran (or was swapped
+            # out, like in benchmarks/api_load.py). Releasing is what takes the accept-time manifest
+            # out of find_resumable(), so a finished job isn't run again on the next start.
+            workspace_manager.release(task_id, success=terminal_status == "COMPLETE")
+        release_claim(task_id)
+
+
+# Holds on to resumed jobs' asyncio tasks (the event loop only keeps weak references)
+RESUMED_JOBS: Set[asyncio.Task] = set()
+
+
+def resume_interrupted_jobs() -> int:
+    """
+    Re-queues video jobs that a crashed or restarted process left unfinished in its workspaces.
+    Each one picks up from its checkpoint manifest. Called once at API startup.
+    """
+    resumed = 0
+    for task_id, request_data in find_resumable(settings.WORKSPACE_ROOT, settings.RESUME_MAX_AGE_SECONDS):
+        status = (_redis_get(task_id) or {}).get("status")
+        if status in TERMINAL_STATUSES:
+            # Finished or cancelled elsewhere; release it so it isn't picked up again on the next start
+            workspace_manager.allocate(task_id)
+            workspace_manager.release(task_id, success=status != "FAILED")
+            release_claim(task_id)
+            continue
+        try:
+            request = VideoGenerationRequest(**request_data)
+        except Exception as e:
+            print(f"[generator] Could not resume {task_id}, its checkpointed request is invalid: {e}")
+            release_claim(task_id)
+            continue
+        # Marks it active so the sweeper leaves it alone while it waits for a slot
+        workspace_manager.allocate(task_id)
+        # It was accepted before the restart, so it doesn't have to compete for a queue place again
+        admission_controller.admit(task_id, request.quality, force=True)
+        QUEUE_DEPTH.inc()
+        _redis_set(task_id, {"status": "ACCEPTED", "message": "Resuming after a server restart."}, expire_seconds=3600)
+        job = asyncio.create_task(run_video_generation_pipeline(task_id, request))
+        RESUMED_JOBS.add(job)
+        job.add_done_callback(RESUMED_JOBS.discard)
+        resumed += 1
+    if resumed:
+        print(f"[generator] Resumed {resumed} interrupted job(s) from their checkpoints")
+    return resumed
 
 
 @router.post("/generate-video", status_code=202)
@@ -79,13 +297,28 @@ def generate_video(request: VideoGenerationRequest, background_tasks: Background
     Accepts a video generation request and starts the process in the background.
     """
     task_id = uuid.uuid4().hex
+    _reject_if_full(task_id, request.quality, "generate-video")
     print(f"Received request for {request.student_name}. Adding to background tasks with ID: {task_id}")
 
-    # initialize in store
-    _redis_set(task_id, {"status": "ACCEPTED", "message": "Task accepted."}, expire_seconds=3600)
+    try:
+        # Checkpoint the request right away, so a crash while it's still queued doesn't lose it.
+        # The claim marks it as owned by this process until the job ends.
+        workspace = workspace_manager.allocate(task_id)
+        claim(task_id, workspace.path)
+        TaskManifest.open(workspace.path, task_id, request.dict())
+
+        # initialize in store
+        _redis_set(task_id, {"status": "ACCEPTED", "message": "Task accepted."}, expire_seconds=3600)
 
-    # schedule background task (FastAPI will await async functions)
-    background_tasks.add_task(run_video_generation_pipeline, task_id, request)
+        # schedule background task (FastAPI will await async functions)
+        background_tasks.add_task(run_video_generation_pipeline, task_id, request)
+    except Exception:
+        # Don't leak the queue place or the workspace (e.g. Redis is down)
+        admission_controller.release(task_id)
+        release_claim(task_id)
+        workspace_manager.discard(task_id)
+        raise
+    QUEUE_DEPTH.inc()
 
     # include Location header? Can't set headers from here easily in simple return; return endpoint and task_id.
     return {
@@ -95,6 +328,126 @@ def generate_video(request: VideoGenerationRequest, background_tasks: Background
     }
 
 
+async def run_batch_generation_pipeline(batch_id: str, task_ids: list, request: BatchVideoGenerationRequest):
+    """
+    Background function for a classroom batch: plans once, renders shared scenes once, and updates
+    each student's own task status as their video finishes.
+    """
+    print(f"--- Batch background task started (batch_id={batch_id}, students={len(task_ids)}) ---")
+    batch_record = {"tasks": []}
+    deadline_seconds = request.deadline_seconds or settings.BATCH_DEADLINE_SECONDS
+
+    def abandon_batch(outcome: str):
+        for task_id in task_ids:
+            if (_redis_get(task_id) or {}).get("status") not in TERMINAL_STATUSES:
+                _abandon_task(task_id, outcome, deadline_seconds, batch_id=batch_id)
+        workspace_manager.discard(f"batch_{batch_id}")
+        batch_record.update({"status": outcome, "message": "The classroom batch was cancelled." if outcome == "CANCELLED" else f"The classroom batch did not finish within {deadline_seconds:.0f} seconds."})
+
+    if not await _wait_for_slot(batch_id):
+        try:
+            batch_record = _redis_get(batch_id) or batch_record
+            abandon_batch("CANCELLED")
+            _redis_set(batch_id, batch_record, expire_seconds=86400)
+        finally:
+            CANCEL_REQUESTED.pop(batch_id, None)
+        return
+
+    async def publish_student(task_id: str, final_video_url: Optional[str]):
+        if final_video_url and "R2 Upload Successful: Missing" not in final_video_url:
+            _redis_set(task_id, {"status": "COMPLETE", "url": final_video_url, "batch_id": batch_id, "message": "Video is ready."}, expire_seconds=86400)
+            JOBS_TOTAL.inc(status="COMPLETE")
+        else:
+            _redis_set(task_id, {"status": "FAILED", "batch_id": batch_id, "message": final_video_url or "A critical error occurred."}, expire_seconds=3600)
+            JOBS_TOTAL.inc(status="FAILED")
+
+    # Holds render slots from here on; see run_video_generation_pipeline
+    JOBS_IN_FLIGHT.inc()
+    try:
+        batch_record = _redis_get(batch_id) or batch_record
+        batch_record.update({"status": "IN_PROGRESS", "message": "Planning the lesson for the class..."})
+        _redis_set(batch_id, batch_record, expire_seconds=86400)
+        for task_id in task_ids:
+            _redis_set(task_id, {"status": "IN_PROGRESS", "batch_id": batch_id, "message": "Video generation started (classroom batch)..."}, expire_seconds=3600)
+
+        from app.services.batch_generator import create_batch_videos
+
+        outcome, results = await _run_supervised(
+            batch_id,
+            # Never personalize more students at once than the render slots the batch was granted
+            create_batch_videos(request, batch_id, task_ids, on_student_done=publish_student,
+                                student_concurrency=admission_controller.granted_slots(batch_id)),
+            deadline_seconds
+        )
+        if outcome != "DONE":
+            abandon_batch(outcome)
+        else:
+            succeeded = sum(1 for url in results.values() if url)
+            status = "COMPLETE" if succeeded == len(task_ids) else ("PARTIAL" if succeeded else "FAILED")
+            batch_record.update({"status": status, "message": f"{succeeded}/{len(task_ids)} videos are ready."})
+    except Exception as e:
+        print(f"--- Batch background task failed with an unhandled exception: {e} ---")
+        record_failure("batch", e)
+        for task_id in task_ids:
+            if (_redis_get(task_id) or {}).get("status") == "IN_PROGRESS":
+                await publish_student(task_id, None)
+        batch_record.update({"status": "FAILED", "message": f"An unhandled exception occurred: {e}"})
+    finally:
+        JOBS_IN_FLIGHT.dec()
+        admission_controller.release(batch_id)
+        CANCEL_REQUESTED.pop(batch_id, None)
+        # Last, so a failing store can't keep the slots from being released
+        _redis_set(batch_id, batch_record, expire_seconds=86400)
+
+
+@router.post("/generate-batch", status_code=202)
+def generate_batch(request: BatchVideoGenerationRequest, background_tasks: BackgroundTasks):
+    """
+    Accepts one lesson for a whole class. The lesson is planned once and scenes that don't mention
+    the student are rendered once; every student still gets their own task_id and video URL.
+    """
+    batch_id = uuid.uuid4().hex
+    # Students are built BATCH_STUDENT_CONCURRENCY at a time, so the batch holds that many render slots
+    concurrency = settings.BATCH_STUDENT_CONCURRENCY
+    _reject_if_full(batch_id, request.quality, "generate-batch",
+                    cost=math.ceil(len(request.student_names) / concurrency), slots=concurrency)
+    tasks = [{"student_name": name, "task_id": uuid.uuid4().hex} for name in request.student_names]
+    print(f"Received classroom batch for {len(tasks)} students. Batch ID: {batch_id}")
+
+    try:
+        for task in tasks:
+            _redis_set(task["task_id"], {"status": "ACCEPTED", "batch_id": batch_id, "message": "Task accepted."}, expire_seconds=3600)
+        _redis_set(batch_id, {"status": "ACCEPTED", "message": "Batch accepted.", "tasks": tasks}, expire_seconds=86400)
+
+        background_tasks.add_task(run_batch_generation_pipeline, batch_id, [t["task_id"] for t in tasks], request)
+    except Exception:
+        admission_controller.release(batch_id)
+        raise
+    QUEUE_DEPTH.inc()
+
+    return {
+        "message": "Classroom batch accepted. Poll /check-status/{task_id} per student, or /batch-status/{batch_id} for the whole class.",
+        "batch_id": batch_id,
+        "tasks": tasks,
+    }
+
+
+@router.get("/batch-status/{batch_id}")
+def batch_status(batch_id: str):
+    """
+    Status of a classroom batch, with every student's task status.
+    """
+    batch_record = _redis_get(batch_id)
+    if not batch_record or "tasks" not in batch_record:
+        raise HTTPException(status_code=404, detail="Batch ID not found.")
+
+    students = []
+    for task in batch_record["tasks"]:
+        status_info = _redis_get(task["task_id"]) or {"status": "UNKNOWN"}
+        students.append({**task, "status": status_info.get("status"), "url": status_info.get("url")})
+    return {"batch_id": batch_id, "status": batch_record.get("status"), "message": batch_record.get("message"), "students": students}
+
+
 @router.get("/check-status/{task_id}")
 def check_status(task_id: str):
     """
@@ -109,5 +462,67 @@ def check_status(task_id: str):
     if status_info.get("status") == "COMPLETE":
         return {"status": "COMPLETE", "url": status_info["url"]}
 
-    # Otherwise return whatever we have (IN_PROGRESS/FAILED/ACCEPTED)
+    # Still waiting or rendering on this host: add queue position and ETA (batch students share the batch's)
+    if status_info.get("status") not in TERMINAL_STATUSES:
+        eta = admission_controller.status(task_id) or admission_controller.status(status_info.get("batch_id") or "")
+        if eta:
+            status_info.update(eta)
+
+    # Otherwise return whatever we have (IN_PROGRESS/PREVIEW_READY/FAILED/ACCEPTED)
     return status_info
+
+
+@router.delete("/tasks/{task_id}", status_code=202)
+async def cancel_task(task_id: str):
+    """
+    Cancels a queued or running video (or a whole classroom batch, by batch_id).
+    Running work is stopped, child manim/ffmpeg processes are killed and the workspace is deleted;
+    the task then reports CANCELLED.
+    """
+    status_info = _redis_get(task_id)
+    if not status_info:
+        raise HTTPException(status_code=404, detail="Task ID not found.")
+    if status_info.get("status") in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Task already finished with status {status_info['status']}.")
+    if status_info.get("batch_id") and "tasks" not in status_info:
+        raise HTTPException(status_code=409, detail=f"This video is part of classroom batch {status_info['batch_id']}; cancel the batch instead.")
+
+    _request_cancel(task_id)
+    # Frees its queue place if it was still waiting; a running job keeps its slot until it has
+    # actually stopped (its runner releases it)
+    admission_controller.withdraw(task_id)
+    job = RUNNING_JOBS.get(task_id)
+    if job is not None:
+        job.cancel()
+
+    status_info.update({"status": "CANCELLING", "message": "Cancellation requested."})
+    _redis_set(task_id, status_info, expire_seconds=3600)
+    return {"task_id": task_id, "status": "CANCELLING"}
+
+
+@router.get("/tasks/{task_id}/trace")
+def get_task_trace(task_id: str):
+    """
+    Timeline of a task's pipeline stages in Chrome trace JSON (load it in chrome://tracing or ui.perfetto.dev).
+    Traces are kept in memory on the replica that ran the task, for the most recent tasks only.
+    """
+    trace = tracing.get_trace(task_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace recorded for this task ID on this server.")
+    return trace.to_chrome_trace()
+
+
+@router.get("/admission")
+def admission_status():
+    """
+    Render slots and queue on this host, with the recent per-stage timings ETAs are based on.
+    """
+    return admission_controller.snapshot()
+
+
+@router.get("/workspaces")
+def workspace_usage():
+    """
+    Disk usage of this host's task workspaces (active and retained-for-debugging).
+    """
+    return workspace_manager.usage()
@@ -1,12 +1,28 @@
 # lets use gemini 2.0 flash for api calls because its smart and fast lfg
-
-import google.generativeai as genai
+# The Gemini SDK is heavy and only the render workers need it, so the client is built on first use
+# instead of at import time (keeps API startup and /health fast).
+import threading
 from .config import settings
 
-# Configure the Gemini API client
-genai.configure(api_key=settings.GEMINI_API_KEY)
+GEMINI_MODEL_NAME = 'gemini-2.5-flash-lite'
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Returns the shared Gemini model, configuring the client the first time it's needed."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+
+                # Configure the Gemini API client
+                genai.configure(api_key=settings.GEMINI_API_KEY)
 
-# Initialize the model
-model = genai.GenerativeModel('gemini-2.5-flash-lite')
+                # Initialize the model
+                _model = genai.GenerativeModel(GEMINI_MODEL_NAME)
 
-print("Gemini model initialized successfully.")
\ No newline at end of file
+                print("Gemini model initialized successfully.")
+    return _model
@@ -16,6 +16,43 @@ class Settings:
     ELEVENLABS_API_KEY: str = os.getenv("ELEVENLABS_API_KEY")
     R2_PUBLIC_URL_BASE: str = os.getenv("R2_PUBLIC_URL_BASE") 
 
+    # --- Task workspaces (see app/services/workspace.py) ---
+    WORKSPACE_ROOT: str = os.getenv("WORKSPACE_ROOT", "/tmp/math_toons_assets")
+    # Optional RAM-backed dir (e.g. /dev/shm/math_toons) for hot intermediates like Manim media and audio
+    WORKSPACE_TMPFS_DIR: str = os.getenv("WORKSPACE_TMPFS_DIR")
+    WORKSPACE_TMPFS_QUOTA_BYTES: int = int(os.getenv("WORKSPACE_TMPFS_QUOTA_BYTES", str(2 * 1024 ** 3)))
+    WORKSPACE_QUOTA_BYTES: int = int(os.getenv("WORKSPACE_QUOTA_BYTES", str(20 * 1024 ** 3)))
+    # How long a failed task's files are kept around for debugging
+    WORKSPACE_FAILED_RETENTION_SECONDS: int = int(os.getenv("WORKSPACE_FAILED_RETENTION_SECONDS", str(24 * 3600)))
+
+    # --- Deadlines and timeouts ---
+    # Default wall-clock budget for one video job (requests can ask for less/more via deadline_seconds)
+    JOB_DEADLINE_SECONDS: int = int(os.getenv("JOB_DEADLINE_SECONDS", str(30 * 60)))
+    BATCH_DEADLINE_SECONDS: int = int(os.getenv("BATCH_DEADLINE_SECONDS", str(4 * 3600)))
+    # A single manim scene is killed (and skipped) after this long
+    SCENE_RENDER_TIMEOUT_SECONDS: int = int(os.getenv("SCENE_RENDER_TIMEOUT_SECONDS", "300"))
+    # Per-request timeout for Gemini and ElevenLabs calls
+    PROVIDER_TIMEOUT_SECONDS: int = int(os.getenv("PROVIDER_TIMEOUT_SECONDS", "120"))
+    # How often a running job checks the shared store for a cancel issued on another replica
+    CANCEL_POLL_SECONDS: float = float(os.getenv("CANCEL_POLL_SECONDS", "5"))
+
+    # --- Admission control (see app/services/admission.py) ---
+    # Jobs rendering at once on this host; the rest wait in a queue of at most MAX_QUEUED_JOBS, then get 429
+    MAX_ACTIVE_JOBS: int = int(os.getenv("MAX_ACTIVE_JOBS", "2"))
+    MAX_QUEUED_JOBS: int = int(os.getenv("MAX_QUEUED_JOBS", "20"))
+    # ETAs average the per-stage timings of this many recent jobs per quality
+    ETA_WINDOW_JOBS: int = int(os.getenv("ETA_WINDOW_JOBS", "20"))
+    # Assumed job length until a quality has been measured
+    ETA_DEFAULT_JOB_SECONDS: float = float(os.getenv("ETA_DEFAULT_JOB_SECONDS", "600"))
+    # Students a classroom batch personalizes at once; the batch holds this many render slots
+    BATCH_STUDENT_CONCURRENCY: int = int(os.getenv("BATCH_STUDENT_CONCURRENCY", "2"))
+
+    # --- Checkpoints (see app/services/checkpoint.py) ---
+    # Re-queue jobs a crashed/restarted process left unfinished in WORKSPACE_ROOT when the API starts
+    RESUME_INTERRUPTED_JOBS: bool = os.getenv("RESUME_INTERRUPTED_JOBS", "true").lower() in ("1", "true", "yes")
+    # Jobs whose last checkpoint is older than this are left for the workspace sweeper instead
+    RESUME_MAX_AGE_SECONDS: int = int(os.getenv("RESUME_MAX_AGE_SECONDS", str(6 * 3600)))
+
 
     # print(GEMINI_API_KEY)
     # print(CUSTOM_TTS_API_URL)
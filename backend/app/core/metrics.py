@@ -0,0 +1,150 @@
+# backend/app/core/metrics.py
+# A tiny in-process metrics registry rendered in the Prometheus text format on /metrics.
+# Kept dependency-free on purpose: it's a handful of counters, gauges and histograms.
+import time
+import threading
+from contextlib import contextmanager
+
+from app.core import tracing
+
+_REGISTRY = []
+
+
+def _label_key(labelnames, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, key, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, key)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + 1 if value <= bound else c for c, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': bound})} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render_prometheus() -> str:
+    """Everything in the registry, in the Prometheus text exposition format."""
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Pipeline metrics ---
+STAGE_DURATION = Histogram("mathtoons_stage_duration_seconds", "Wall-clock time spent in each pipeline stage.", ["stage"])
+SCENE_DURATION = Histogram("mathtoons_scene_duration_seconds", "Wall-clock time to render, voice and combine a single scene.", ["quality"])
+QUEUE_DEPTH = Gauge("mathtoons_queue_depth", "Jobs accepted but not yet started.")
+JOBS_IN_FLIGHT = Gauge("mathtoons_jobs_in_flight", "Jobs currently running through the pipeline.")
+JOBS_TOTAL = Counter("mathtoons_jobs_total", "Finished jobs by final status.", ["status"])
+FAILURES = Counter("mathtoons_failures_total", "Failures by pipeline stage and cause (exception type).", ["stage", "cause"])
+CACHE_REQUESTS = Counter("mathtoons_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+ADMISSION_REJECTIONS = Counter("mathtoons_admission_rejections_total", "Requests turned away with 429 because the host was at capacity.", ["endpoint"])
+UPLOAD_BYTES = Counter("mathtoons_upload_bytes_total", "Bytes uploaded to object storage.")
+
+# Unlabelled series only show up once touched, so start them at zero
+QUEUE_DEPTH.set(0)
+JOBS_IN_FLIGHT.set(0)
+UPLOAD_BYTES.inc(0)
+
+
+def record_failure(stage: str, error) -> None:
+    cause = error if isinstance(error, str) else type(error).__name__
+    FAILURES.inc(stage=stage, cause=cause)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def timed_stage(stage: str, **trace_args):
+    """
+    Times a block as a pipeline stage: observes the stage histogram, counts failures by cause,
+    and adds a span to the current task's trace (if there is one).
+    Works around awaits too, e.g. `with timed_stage("tts"): await generate_tts_audio(...)`.
+    """
+    start = time.perf_counter()
+    with tracing.span(stage, **trace_args):
+        try:
+            yield
+        except Exception as e:
+            record_failure(stage, e)
+            raise
+        finally:
+            STAGE_DURATION.observe(time.perf_counter() - start, stage=stage)
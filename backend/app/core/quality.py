@@ -0,0 +1,39 @@
+# backend/app/core/quality.py
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """Every knob that affects render/encode cost, kept together so the whole pipeline agrees."""
+    name: str
+    manim_quality: str   # manim's -q flag: l (480p), m (720p), h (1080p)
+    height: int
+    fps: int
+    x264_preset: str
+    crf: int
+    audio_bitrate: str
+
+    @property
+    def manim_flag(self) -> str:
+        return f"-q{self.manim_quality}"
+
+    @property
+    def manim_output_dir(self) -> str:
+        # Manim writes to videos/<script>/<height>p<fps>/
+        return f"{self.height}p{self.fps}"
+
+
+QUALITY_PROFILES = {
+    # Throwaway drafts: as cheap as we can make it while still being watchable
+    "preview": EncodingProfile("preview", "l", 480, 15, "ultrafast", 30, "64k"),
+    # What every request used before tiers existed (-qm, 720p30)
+    "standard": EncodingProfile("standard", "m", 720, 30, "veryfast", 23, "128k"),
+    "final": EncodingProfile("final", "h", 1080, 30, "medium", 20, "192k"),
+}
+
+DEFAULT_QUALITY = "standard"
+
+
+def get_profile(quality: str = None) -> EncodingProfile:
+    """Returns the encoding profile for a quality tier, falling back to the default tier."""
+    return QUALITY_PROFILES.get(quality or DEFAULT_QUALITY, QUALITY_PROFILES[DEFAULT_QUALITY])
@@ -0,0 +1,106 @@
+# backend/app/core/tracing.py
+# Per-task trace timelines in the Chrome trace event format (open them in chrome://tracing or Perfetto).
+import os
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+MAX_TRACES = 200
+
+_current_trace = contextvars.ContextVar("mathtoons_trace", default=None)
+_current_lane = contextvars.ContextVar("mathtoons_trace_lane", default="pipeline")
+
+
+class TaskTrace:
+    """Collects spans for a single task. Lanes ("pipeline", "scene 3", ...) become trace threads."""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._events = []
+        self._lanes = {}
+        self._lock = threading.Lock()
+
+    def _lane_id(self, lane: str) -> int:
+        if lane not in self._lanes:
+            self._lanes[lane] = len(self._lanes) + 1
+        return self._lanes[lane]
+
+    def add_span(self, name: str, start: float, end: float, lane: str, args: dict = None):
+        """start/end are time.perf_counter() readings."""
+        with self._lock:
+            self._events.append({
+                "name": name,
+                "cat": "pipeline",
+                "ph": "X",
+                "ts": round((start - self._origin) * 1e6),
+                "dur": round((end - start) * 1e6),
+                "pid": os.getpid(),
+                "tid": self._lane_id(lane),
+                "args": args or {},
+            })
+
+    def stage_totals(self) -> dict:
+        """Total seconds spent per span name, summed across lanes."""
+        totals = {}
+        with self._lock:
+            for event in self._events:
+                totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1e6
+        return totals
+
+    def to_chrome_trace(self) -> dict:
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": lane}}
+                for lane, tid in self._lanes.items()
+            ]
+            return {
+                "traceEvents": metadata + list(self._events),
+                "displayTimeUnit": "ms",
+                "otherData": {"task_id": self.task_id, "started_at": self.started_at},
+            }
+
+
+_traces: "OrderedDict[str, TaskTrace]" = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+def start_trace(task_id: str) -> TaskTrace:
+    """Creates a trace for the task and makes it current for this async context."""
+    trace = TaskTrace(task_id)
+    with _traces_lock:
+        _traces[task_id] = trace
+        while len(_traces) > MAX_TRACES:
+            _traces.popitem(last=False)
+    _current_trace.set(trace)
+    return trace
+
+
+def get_trace(task_id: str) -> Optional[TaskTrace]:
+    with _traces_lock:
+        return _traces.get(task_id)
+
+
+def current_trace() -> Optional[TaskTrace]:
+    return _current_trace.get()
+
+
+def set_lane(lane: str):
+    """Puts subsequent spans in this async context on their own timeline row (e.g. one per scene)."""
+    _current_lane.set(lane)
+
+
+@contextmanager
+def span(name: str, **args):
+    """Records a span on the current trace; a no-op outside a traced task."""
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add_span(name, start, time.perf_counter(), _current_lane.get(), args)
@@ -1,7 +1,10 @@
 # backend/app/main.py
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api.endpoints import generator
+from app.core.config import settings
+from app.core.metrics import render_prometheus
 
 app = FastAPI(
     title="Math Toons API",
@@ -26,9 +29,26 @@ app.add_middleware(
 # Include router
 app.include_router(generator.router, prefix="/api/v1", tags=["Video Generation"])
 
+@app.on_event("startup")
+async def resume_interrupted_jobs():
+    """
+    Picks interrupted video jobs back up from their checkpoints (see app/services/checkpoint.py).
+    """
+    if settings.RESUME_INTERRUPTED_JOBS:
+        generator.resume_interrupted_jobs()
+
+
 @app.get("/health", tags=["Health Check"])
 def health_check():
     """
     Simple health check to confirm the API is running.
     """
-    return {"status": "LETSGO (Health: ok)"}
\ No newline at end of file
+    return {"status": "LETSGO (Health: ok)"}
+
+
+@app.get("/metrics", tags=["Health Check"], response_class=PlainTextResponse)
+def metrics():
+    """
+    Pipeline metrics (stage latencies, queue depth, failures, ...) in Prometheus text format.
+    """
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -1,10 +1,34 @@
 # backend/app/models/video.py
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal, Optional
 
 class VideoGenerationRequest(BaseModel):
     student_name: str = Field(..., example="Rohan")
     topic: str = Field(..., example="Simple addition with numbers up to 10")
     artifacts: List[str] = Field(..., example=["Apple", "Banana"])
     character_preset: str = Field(..., example="doraemon")
-    lang: str = Field(..., example="en", description="Language code: 'en', 'hi', or 'mr'")
\ No newline at end of file
+    lang: str = Field(..., example="en", description="Language code: 'en', 'hi', or 'mr'")
+    quality: Literal["preview", "standard", "final"] = Field("standard", example="standard", description="Render tier: 'preview' (480p15, fast), 'standard' (720p30) or 'final' (1080p30)")
+    preview_first: bool = Field(False, example=False, description="Upload a fast preview render first, then replace it with the requested quality")
+    deadline_seconds: Optional[int] = Field(None, gt=0, le=4 * 3600, example=1800, description="Give up (TIMED_OUT) if the video isn't done after this many seconds. Defaults to the server's JOB_DEADLINE_SECONDS")
+
+
+class BatchVideoGenerationRequest(BaseModel):
+    """One lesson for a whole classroom: planned once, personalized per student."""
+    student_names: List[str] = Field(..., min_items=1, max_items=100, example=["Rohan", "Priya", "Aarav"])
+    topic: str = Field(..., example="Simple addition with numbers up to 10")
+    artifacts: List[str] = Field(..., example=["Apple", "Banana"])
+    character_preset: str = Field(..., example="doraemon")
+    lang: str = Field(..., example="en", description="Language code: 'en', 'hi', or 'mr'")
+    quality: Literal["preview", "standard", "final"] = Field("standard", example="standard", description="Render tier: 'preview' (480p15, fast), 'standard' (720p30) or 'final' (1080p30)")
+    deadline_seconds: Optional[int] = Field(None, gt=0, le=12 * 3600, example=7200, description="Give up on the whole batch after this many seconds. Defaults to the server's BATCH_DEADLINE_SECONDS")
+
+    def for_student(self, student_name: str) -> VideoGenerationRequest:
+        return VideoGenerationRequest(
+            student_name=student_name,
+            topic=self.topic,
+            artifacts=self.artifacts,
+            character_preset=self.character_preset,
+            lang=self.lang,
+            quality=self.quality,
+        )
@@ -0,0 +1,203 @@
+# backend/app/services/admission.py
+import math
+import time
+import heapq
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+# Top-level trace spans that run one after another in a video job (see video_generator.create_personalized_video)
+ETA_STAGES = ("plan", "render")
+
+
+@dataclass
+class _Job:
+    job_id: str
+    quality: str
+    cost: float  # in units of one video of that quality (a classroom batch costs more)
+    slots: int  # render slots held while running (a batch renders several students at once)
+    enqueued_at: float
+    started_at: Optional[float] = None
+    waiter: Optional[asyncio.Future] = None
+
+
+def _iso(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class AdmissionController:
+    """
+    Caps how many renders run at once on this host and how many jobs may wait for a slot.
+    - admit() reserves a place in the queue at submit time, or says how long to wait before retrying.
+    - acquire() waits (FIFO) until the job's slots are free out of `max_active`; release() frees them.
+    - ETAs come from the last `window_jobs` finished jobs per quality, timed per stage.
+    """
+
+    def __init__(self, max_active: int, max_queued: int, window_jobs: int, default_job_seconds: float):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.window_jobs = window_jobs
+        self.default_job_seconds = default_job_seconds
+        self._active: "OrderedDict[str, _Job]" = OrderedDict()
+        self._queued: "OrderedDict[str, _Job]" = OrderedDict()
+        self._stage_samples: Dict[str, Dict[str, deque]] = {}
+        self._lock = threading.Lock()
+
+    # --- Admission ---
+
+    def admit(self, job_id: str, quality: str, cost: float = 1.0, slots: int = 1, force: bool = False) -> Optional[int]:
+        """
+        Queues the job. Returns None if admitted, else the number of seconds to wait before retrying.
+        `slots` is capped at max_active; use granted_slots() to see what the job will actually hold.
+        `force` queues it even when full (for work that was already accepted, e.g. resumed jobs).
+        """
+        with self._lock:
+            if not force and len(self._active) + len(self._queued) >= self.max_active + self.max_queued:
+                return self._retry_after_locked()
+            slots = max(1, min(slots, self.max_active))
+            self._queued[job_id] = _Job(job_id, quality, cost, slots, enqueued_at=time.time())
+            return None
+
+    def granted_slots(self, job_id: str) -> int:
+        with self._lock:
+            job = self._active.get(job_id) or self._queued.get(job_id)
+            return job.slots if job else 1
+
+    def _used_slots_locked(self) -> int:
+        return sum(job.slots for job in self._active.values())
+
+    async def acquire(self, job_id: str) -> bool:
+        """Waits for the job's render slots. Returns False if the job was released (e.g. cancelled) while it waited."""
+        with self._lock:
+            job = self._queued.get(job_id)
+            if job is None:
+                return job_id in self._active
+            # Don't jump ahead of a job that's already waiting (e.g. a batch waiting for two slots)
+            waiting_ahead = any(other.waiter is not None for other in self._queued.values() if other is not job)
+            if not waiting_ahead and self._used_slots_locked() + job.slots <= self.max_active:
+                self._start_locked(job)
+                return True
+            job.waiter = asyncio.get_running_loop().create_future()
+            waiter = job.waiter
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            self.release(job_id)
+            raise
+
+    def release(self, job_id: str):
+        """Frees the job's slots or queue place and hands free slots to the next waiting jobs."""
+        with self._lock:
+            self._release_locked(job_id)
+
+    def withdraw(self, job_id: str) -> bool:
+        """Drops a job that is still waiting for a slot. A running job keeps its slots. Returns True if it was queued."""
+        with self._lock:
+            if job_id not in self._queued:
+                return False
+            self._release_locked(job_id)
+            return True
+
+    def _release_locked(self, job_id: str):
+        self._active.pop(job_id, None)
+        job = self._queued.pop(job_id, None)
+        if job is not None and job.waiter is not None and not job.waiter.done():
+            job.waiter.set_result(False)
+        # Strictly FIFO among waiters, so a multi-slot job isn't starved by single-slot ones behind it
+        for waiting in list(self._queued.values()):
+            if waiting.waiter is None or waiting.waiter.done():
+                continue
+            if self._used_slots_locked() + waiting.slots > self.max_active:
+                break
+            self._start_locked(waiting)
+            waiting.waiter.set_result(True)
+
+    def _start_locked(self, job: _Job):
+        del self._queued[job.job_id]
+        job.started_at = time.time()
+        self._active[job.job_id] = job
+
+    # --- Throughput and ETAs ---
+
+    def record(self, quality: str, stage_totals: dict):
+        """Feeds a finished job's per-stage seconds (from its trace) into the ETA window."""
+        with self._lock:
+            samples = self._stage_samples.setdefault(quality, {})
+            for stage in ETA_STAGES:
+                if stage in stage_totals:
+                    samples.setdefault(stage, deque(maxlen=self.window_jobs)).append(stage_totals[stage])
+
+    def _stage_means_locked(self, quality: str) -> dict:
+        return {stage: sum(values) / len(values) for stage, values in self._stage_samples.get(quality, {}).items() if values}
+
+    def _expected_seconds_locked(self, job: _Job) -> float:
+        means = self._stage_means_locked(job.quality)
+        per_video = sum(means.values()) if means else self.default_job_seconds
+        return per_video * job.cost
+
+    def _schedule_locked(self, now: float):
+        """
+        Plays the queue forward: every slot frees up when its job's expected time runs out, and queued
+        jobs start in order once they have all the slots they need.
+        Returns ({job_id: (position, start, finish)}, slot free times heap).
+        """
+        schedule, slots = {}, []
+        for job in self._active.values():
+            expected = self._expected_seconds_locked(job)
+            # A job running over its estimate is assumed to be nearly done rather than already finished
+            finish = now + max(expected - (now - job.started_at), 0.1 * expected)
+            schedule[job.job_id] = (0, job.started_at, finish)
+            slots += [finish] * job.slots
+        slots += [now] * max(0, self.max_active - len(slots))
+        heapq.heapify(slots)
+        for position, job in enumerate(self._queued.values(), start=1):
+            freed = [heapq.heappop(slots) for _ in range(min(job.slots, len(slots)))]
+            start = max(freed) if freed else now
+            finish = start + self._expected_seconds_locked(job)
+            for _ in range(job.slots):
+                heapq.heappush(slots, finish)
+            schedule[job.job_id] = (position, start, finish)
+        return schedule, slots
+
+    def _retry_after_locked(self) -> int:
+        now = time.time()
+        schedule, slots = self._schedule_locked(now)
+        if self._queued:
+            # A queue place opens up when the first queued job gets a slot
+            first = next(iter(self._queued))
+            opens_at = schedule[first][1]
+        else:
+            opens_at = slots[0] if slots else now
+        return max(1, math.ceil(opens_at - now))
+
+    def status(self, job_id: str) -> Optional[dict]:
+        """Queue position and estimated start/finish for a queued or running job, or None if it isn't here."""
+        with self._lock:
+            if job_id not in self._active and job_id not in self._queued:
+                return None
+            position, start, finish = self._schedule_locked(time.time())[0][job_id]
+        return {"queue_position": position, "estimated_start": _iso(start), "estimated_finish": _iso(finish)}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stage_seconds = {quality: self._stage_means_locked(quality) for quality in self._stage_samples}
+            return {
+                "max_active": self.max_active,
+                "max_queued": self.max_queued,
+                "active": len(self._active),
+                "slots_in_use": self._used_slots_locked(),
+                "queued": len(self._queued),
+                "stage_seconds": {q: {s: round(v, 2) for s, v in means.items()} for q, means in stage_seconds.items()},
+            }
+
+
+admission_controller = AdmissionController(
+    max_active=settings.MAX_ACTIVE_JOBS,
+    max_queued=settings.MAX_QUEUED_JOBS,
+    window_jobs=settings.ETA_WINDOW_JOBS,
+    default_job_seconds=settings.ETA_DEFAULT_JOB_SECONDS,
+)
@@ -0,0 +1,251 @@
+# backend/app/services/batch_generator.py
+import os
+import re
+import ast
+import asyncio
+import time
+from typing import Dict, List, Tuple
+
+from app.models.video import BatchVideoGenerationRequest
+from app.core.config import settings
+from app.core import tracing
+from app.core.metrics import record_cache, record_failure, timed_stage, SCENE_DURATION
+from app.core.quality import EncodingProfile, get_profile
+from app.services.tts_generator import generate_tts_audio
+from app.services.manim_generator import render_manim_script
+from app.services.video_stitcher import combine_scene_assets, stitch_final_video
+from app.services.workspace import Workspace, workspace_manager
+from app.services.video_generator import STUDENT_NAME_PLACEHOLDER, plan_video, upload_and_build_url
+
+# How many students are personalized/stitched at the same time (by default)
+STUDENT_CONCURRENCY = settings.BATCH_STUDENT_CONCURRENCY
+
+SCENE_CLASS_NAME = re.compile(r'^Scene\d+$')
+
+
+def split_scene_classes(script_text: str) -> Tuple[Dict[str, str], str]:
+    """
+    Maps each top-level `SceneN` class in a master script to its source, and returns everything else
+    in the module (imports, constants, helper functions and classes) as the second value.
+    Raises SyntaxError if the script doesn't parse.
+    """
+    tree = ast.parse(script_text)
+    lines = script_text.splitlines(keepends=True)
+    sources, covered = {}, set()
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and SCENE_CLASS_NAME.match(node.name):
+            start = (node.decorator_list[0].lineno if node.decorator_list else node.lineno) - 1
+            sources[node.name] = "".join(lines[start:node.end_lineno])
+            covered.update(range(start, node.end_lineno))
+    rest = "".join(line for i, line in enumerate(lines) if i not in covered)
+    return sources, rest
+
+
+def _python_string_safe(name: str) -> str:
+    """Escapes a name so it can be dropped inside any Python string literal in the script."""
+    return name.replace("\\", "\\\\").replace('"', '\\"').replace("'", "\\'")
+
+
+def classify_scenes(storyboard: list, script_text: str) -> Dict[int, Tuple[bool, bool]]:
+    """
+    For each scene number, works out whether its video and/or its narration mention the student.
+    Scenes that mention nobody are rendered once and shared by the whole class.
+    """
+    try:
+        class_sources, module_source = split_scene_classes(script_text)
+    except SyntaxError:
+        # Can't tell which code belongs to which scene; judge the script as a whole
+        class_sources, module_source = {}, script_text
+    # Constants and helpers outside the scene classes can be used by any scene, so the name
+    # showing up there makes every scene's video personal
+    module_personal = STUDENT_NAME_PLACEHOLDER in module_source
+
+    personalization = {}
+    for scene in storyboard:
+        scene_num = scene['scene_number']
+        source = class_sources.get(f"Scene{scene_num}")
+        if module_personal:
+            video_personal = True
+        elif source is None:
+            # Can't see the code for this scene; trust the description instead
+            video_personal = STUDENT_NAME_PLACEHOLDER in scene.get('scene_description', '')
+        else:
+            video_personal = STUDENT_NAME_PLACEHOLDER in source
+        audio_personal = STUDENT_NAME_PLACEHOLDER in scene.get('narration', '')
+        personalization[scene_num] = (video_personal, audio_personal)
+    return personalization
+
+
+async def _render_scene_video(script_path: str, output_dir: str, scene_num: int, profile: EncodingProfile) -> str:
+    render_success, video_path_or_error = await asyncio.to_thread(
+        render_manim_script, script_path, output_dir, f"Scene{scene_num}", profile
+    )
+    if not render_success:
+        raise Exception(f"Failed to render scene {scene_num}: {video_path_or_error}")
+    return video_path_or_error
+
+
+async def _render_shared_assets(batch_request: BatchVideoGenerationRequest, storyboard: list, script_path: str,
+                                personalization: dict, workspace: Workspace, profile: EncodingProfile):
+    """Renders every scene video and narration that doesn't depend on the student, once for the class."""
+    videos, audios = {}, {}
+    semaphore = asyncio.Semaphore(1)
+
+    async def render_shared(scene):
+        async with semaphore:
+            scene_num = scene['scene_number']
+            video_personal, audio_personal = personalization[scene_num]
+            tracing.set_lane(f"shared scene {scene_num}")
+            started = time.perf_counter()
+            jobs = {}
+            if not video_personal:
+                jobs["video"] = _render_scene_video(script_path, workspace.scratch, scene_num, profile)
+            if not audio_personal:
+                jobs["audio"] = generate_tts_audio(scene['narration'], batch_request.character_preset, workspace.scratch, batch_request.lang)
+            results = dict(zip(jobs.keys(), await asyncio.gather(*jobs.values())))
+            if "video" in results:
+                videos[scene_num] = results["video"]
+            if "audio" in results:
+                audios[scene_num] = results["audio"]
+            if jobs:
+                SCENE_DURATION.observe(time.perf_counter() - started, quality=profile.name)
+
+    results = await asyncio.gather(*(render_shared(scene) for scene in storyboard), return_exceptions=True)
+    for scene, result in zip(storyboard, results):
+        if isinstance(result, Exception):
+            print(f"  [Batch] !!! WARNING: Shared assets for scene {scene['scene_number']} failed; it will be SKIPPED for every student. Error: {result}")
+    return videos, audios
+
+
+async def _build_student_video(batch_request: BatchVideoGenerationRequest, student_name: str, task_id: str,
+                               storyboard: list, template_script: str, personalization: dict,
+                               shared_videos: dict, shared_audios: dict, shared_combined: dict,
+                               profile: EncodingProfile) -> str:
+    """Renders only this student's personalized pieces, then combines, stitches and uploads their video."""
+    workspace = workspace_manager.allocate(task_id)
+    final_video_url = None
+    try:
+        tracing.set_lane(f"student {student_name}")
+        script_path = None
+        if any(video_personal for video_personal, _ in personalization.values()):
+            script_path = os.path.join(workspace.path, f"master_script_{task_id[:8]}.py")
+            with open(script_path, "w") as f:
+                f.write(template_script.replace(STUDENT_NAME_PLACEHOLDER, _python_string_safe(student_name)))
+
+        combined_scene_paths = []
+        for scene in storyboard:
+            scene_num = scene['scene_number']
+            video_personal, audio_personal = personalization[scene_num]
+            try:
+                if scene_num in shared_combined:
+                    record_cache("batch_scene", hit=True)
+                    combined_scene_paths.append(shared_combined[scene_num])
+                    continue
+                record_cache("batch_scene", hit=False)
+
+                started = time.perf_counter()
+                if video_personal:
+                    video_path = await _render_scene_video(script_path, workspace.scratch, scene_num, profile)
+                else:
+                    video_path = shared_videos[scene_num]
+                if audio_personal:
+                    narration = scene['narration'].replace(STUDENT_NAME_PLACEHOLDER, student_name)
+                    audio_path = await generate_tts_audio(narration, batch_request.character_preset, workspace.scratch, batch_request.lang)
+                else:
+                    audio_path = shared_audios[scene_num]
+                SCENE_DURATION.observe(time.perf_counter() - started, quality=profile.name)
+
+                combined_scene_paths.append(await asyncio.to_thread(
+                    combine_scene_assets, video_path, audio_path, workspace.scratch, profile
+                ))
+            except Exception as e:
+                # Same policy as a single video: a broken scene is skipped, not fatal
+                print(f"  [Batch] !!! WARNING: Scene {scene_num} failed for {student_name} and will be SKIPPED. Error: {e}")
+
+        if not combined_scene_paths:
+            raise Exception(f"All scenes failed for {student_name}. No video can be created.")
+
+        final_video_path = await asyncio.to_thread(stitch_final_video, combined_scene_paths, workspace.path, profile)
+        student_slug = student_name.lower().replace(' ', '_')
+        final_video_url = await upload_and_build_url(final_video_path, f"{student_slug}/{task_id}.mp4")
+        print(f"  [Batch] Video for {student_name} uploaded: {final_video_url}")
+        return final_video_url
+    finally:
+        workspace_manager.release(task_id, success=final_video_url is not None)
+
+
+async def create_batch_videos(batch_request: BatchVideoGenerationRequest, batch_id: str, task_ids: List[str], on_student_done=None,
+                              student_concurrency: int = STUDENT_CONCURRENCY) -> Dict[str, str]:
+    """
+    Plans a lesson once for the whole class and renders each scene/narration only as many times as needed:
+    once for the class if it doesn't mention the student, once per student if it does.
+    `task_ids[i]` belongs to `batch_request.student_names[i]`. `on_student_done(task_id, url_or_None)` is
+    awaited as each student's video finishes. `student_concurrency` should match the render slots the
+    batch holds. Returns {task_id: url or None}.
+    """
+    profile = get_profile(batch_request.quality)
+    shared_workspace = workspace_manager.allocate(f"batch_{batch_id}")
+    tracing.start_trace(batch_id)
+    results = {task_id: None for task_id in task_ids}
+    finished = set()
+    print(f"[Batch] Starting batch {batch_id}: {len(task_ids)} students, {batch_request.quality} quality")
+
+    async def finish(task_id, url):
+        results[task_id] = url
+        finished.add(task_id)
+        if on_student_done:
+            await on_student_done(task_id, url)
+
+    try:
+        with timed_stage("batch", students=len(task_ids), quality=profile.name):
+            with tracing.span("plan"):
+                storyboard, script_path = await plan_video(batch_request.for_student(STUDENT_NAME_PLACEHOLDER), shared_workspace)
+            with open(script_path) as f:
+                template_script = f.read()
+
+            personalization = classify_scenes(storyboard, template_script)
+            personal_count = sum(1 for v, a in personalization.values() if v or a)
+            print(f"  [Batch] {len(storyboard) - personal_count}/{len(storyboard)} scenes are shared by the whole class.")
+
+            with tracing.span("shared_render"):
+                shared_videos, shared_audios = await _render_shared_assets(
+                    batch_request, storyboard, script_path, personalization, shared_workspace, profile
+                )
+
+            # Fully shared scenes can be combined once, too
+            shared_combined = {}
+            for scene_num, (video_personal, audio_personal) in personalization.items():
+                if not video_personal and not audio_personal and scene_num in shared_videos and scene_num in shared_audios:
+                    try:
+                        shared_combined[scene_num] = await asyncio.to_thread(
+                            combine_scene_assets, shared_videos[scene_num], shared_audios[scene_num], shared_workspace.scratch, profile
+                        )
+                    except Exception as e:
+                        print(f"  [Batch] !!! WARNING: Could not combine shared scene {scene_num}. Error: {e}")
+
+            semaphore = asyncio.Semaphore(student_concurrency)
+
+            async def run_student(student_name, task_id):
+                async with semaphore:
+                    try:
+                        url = await _build_student_video(
+                            batch_request, student_name, task_id, storyboard, template_script, personalization,
+                            shared_videos, shared_audios, shared_combined, profile
+                        )
+                    except Exception as e:
+                        record_failure("batch_student", e)
+                        print(f"  [Batch] Video for {student_name} failed: {e}")
+                        url = None
+                    await finish(task_id, url)
+
+            await asyncio.gather(*(run_student(name, task_id) for name, task_id in zip(batch_request.student_names, task_ids)))
+    except Exception as e:
+        print(f"  [Batch] A critical error occurred during batch {batch_id}: {e}")
+        for task_id in task_ids:
+            if task_id not in finished:
+                await finish(task_id, None)
+    finally:
+        # Shared assets are only useful while the batch runs
+        workspace_manager.release(f"batch_{batch_id}", success=all(results.values()))
+
+    return results
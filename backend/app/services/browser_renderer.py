@@ -1,69 +1,365 @@
 import asyncio
 import os
+import time
 import uuid
 import json
 import base64
+from contextlib import asynccontextmanager
 from playwright.async_api import async_playwright
+from app.core.metrics import timed_stage, record_cache
 
 # The absolute path to your frontend directory
 FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'frontend'))
 INDEX_HTML_PATH = os.path.join(FRONTEND_DIR, 'index.html')
 
-async def render_scene_with_browser(animation_data: dict, output_dir: str) -> str:
+VIEWPORT = {'width': 1280, 'height': 720}
+DEFAULT_FPS = 30
+MAX_BROWSER_PAGES = int(os.environ.get("BROWSER_MAX_PAGES", "4"))
+# Frame-stepped rendering is the default; set BROWSER_VIRTUAL_TIME=0 to record in real time
+USE_VIRTUAL_TIME = os.environ.get("BROWSER_VIRTUAL_TIME", "1") != "0"
+MAX_SCENE_SECONDS = 120
+
+# Injected into every pooled page. It stays inert (everything delegates to the real browser
+# clock) until enable() is called, after which performance.now, Date.now, requestAnimationFrame
+# and timers only move when the renderer calls advance(ms). GSAP and Pixi both drive their
+# tickers off these, so the animation timeline steps exactly 1/fps per captured frame.
+VIRTUAL_TIME_SCRIPT = """
+(() => {
+  const real = {
+    perfNow: performance.now.bind(performance),
+    dateNow: Date.now,
+    raf: window.requestAnimationFrame.bind(window),
+    caf: window.cancelAnimationFrame.bind(window),
+    setTimeout: window.setTimeout.bind(window),
+    clearTimeout: window.clearTimeout.bind(window),
+    setInterval: window.setInterval.bind(window),
+    clearInterval: window.clearInterval.bind(window),
+  };
+  // Virtual timer/rAF ids start far above anything the browser hands out, so they never collide with
+  // real ids (e.g. a timer set before enable()) and clear*/cancel* can tell the two apart
+  const VIRTUAL_ID_BASE = 1e9;
+  const isVirtual = (id) => typeof id === 'number' && id >= VIRTUAL_ID_BASE;
+  const state = { enabled: false, now: 0, dateOffset: 0, complete: false, nextId: VIRTUAL_ID_BASE };
+  let rafCallbacks = new Map();
+  const timers = new Map();
+
+  const origLog = console.log.bind(console);
+  console.log = (...args) => {
+    if (args.some(a => String(a).includes('---ANIMATION_COMPLETE---'))) state.complete = true;
+    origLog(...args);
+  };
+
+  performance.now = () => state.enabled ? state.now : real.perfNow();
+  Date.now = () => state.enabled ? state.dateOffset + state.now : real.dateNow();
+
+  window.requestAnimationFrame = (cb) => {
+    if (!state.enabled) return real.raf(cb);
+    const id = state.nextId++;
+    rafCallbacks.set(id, cb);
+    return id;
+  };
+  window.cancelAnimationFrame = (id) => isVirtual(id) ? rafCallbacks.delete(id) : real.caf(id);
+
+  const addTimer = (cb, ms, args, repeat) => {
+    const id = state.nextId++;
+    const delay = Math.max(0, Number(ms) || 0);
+    timers.set(id, { cb, args, due: state.now + delay, interval: repeat ? Math.max(1, delay) : null });
+    return id;
+  };
+  window.setTimeout = (cb, ms, ...args) => state.enabled ? addTimer(cb, ms, args, false) : real.setTimeout(cb, ms, ...args);
+  window.setInterval = (cb, ms, ...args) => state.enabled ? addTimer(cb, ms, args, true) : real.setInterval(cb, ms, ...args);
+  window.clearTimeout = (id) => isVirtual(id) ? timers.delete(id) : real.clearTimeout(id);
+  window.clearInterval = (id) => isVirtual(id) ? timers.delete(id) : real.clearInterval(id);
+
+  const runTimers = () => {
+    let fired = true;
+    while (fired) {
+      fired = false;
+      for (const [id, t] of [...timers.entries()].sort((a, b) => a[1].due - b[1].due)) {
+        if (t.due > state.now || !timers.has(id)) continue;
+        if (t.interval) { t.due += t.interval; } else { timers.delete(id); }
+        fired = true;
+        typeof t.cb === 'function' ? t.cb(...t.args) : eval(t.cb);
+      }
+    }
+  };
+
+  window.__mtVirtualTime = {
+    enable() {
+      if (state.enabled) return;
+      state.now = real.perfNow();
+      state.dateOffset = real.dateNow() - state.now;
+      state.enabled = true;
+    },
+    advance(ms) {
+      state.now += ms;
+      runTimers();
+      const callbacks = rafCallbacks;
+      rafCallbacks = new Map();
+      callbacks.forEach(cb => cb(state.now));
+      return state.complete;
+    },
+  };
+})();
+"""
+
+
+class BrowserPool:
     """
-    Renders a scene by controlling a headless browser with Playwright.
+    A single long-lived Chromium shared by every scene render.
+    The browser is launched on first use and kept alive across jobs. Each page lives in its
+    own context and is handed back to the pool after a scene, so scenes can render in parallel
+    (up to max_pages at once) without paying the launch cost every time.
     """
-    scene_id = f"scene_{uuid.uuid4().hex[:8]}"
+
+    def __init__(self, max_pages: int = MAX_BROWSER_PAGES):
+        self.max_pages = max_pages
+        self._playwright = None
+        self._browser = None
+        self._launch_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_pages)
+        self._idle_pages = []
+
+    async def _get_browser(self):
+        async with self._launch_lock:
+            launched = self._browser is not None and self._browser.is_connected()
+            record_cache("browser", hit=launched)
+            if not launched:
+                if self._playwright is None:
+                    self._playwright = await async_playwright().start()
+                print("  [Browser] Launching shared Chromium instance...")
+                self._browser = await self._playwright.chromium.launch(headless=True)
+                # Pages from a dead browser are useless
+                self._idle_pages = []
+            return self._browser
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrows a page from the pool, creating one if none are idle."""
+        async with self._slots:
+            browser = await self._get_browser()
+            page = None
+            while self._idle_pages and page is None:
+                candidate = self._idle_pages.pop()
+                if not candidate.is_closed():
+                    page = candidate
+            record_cache("browser_page", hit=page is not None)
+            if page is None:
+                context = await browser.new_context(viewport=VIEWPORT)
+                await context.add_init_script(VIRTUAL_TIME_SCRIPT)
+                page = await context.new_page()
+
+            healthy = False
+            try:
+                yield page
+                healthy = True
+            finally:
+                if healthy and not page.is_closed():
+                    self._idle_pages.append(page)
+                else:
+                    # Don't hand a page in an unknown state to the next scene
+                    try:
+                        await page.context.close()
+                    except Exception:
+                        pass
+
+    async def close(self):
+        """Shuts down the browser and Playwright. Safe to call more than once."""
+        async with self._launch_lock:
+            self._idle_pages = []
+            if self._browser is not None:
+                await self._browser.close()
+                self._browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+
+browser_pool = BrowserPool()
+
+
+class FrameSink:
+    """
+    Pipes JPEG frames straight into an ffmpeg process that encodes them at a constant frame rate.
+    This replaces Playwright's webm recording, so there is no webm-then-transcode step.
+    """
+
+    def __init__(self, output_path: str, fps: int = DEFAULT_FPS):
+        self.output_path = output_path
+        self.fps = fps
+        self.frames_written = 0
+        self._proc = None
+        self._start_ts = None
+        self._last_frame = None
+
+    async def start(self):
+        self._proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "image2pipe", "-c:v", "mjpeg", "-framerate", str(self.fps), "-i", "-",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-r", str(self.fps),
+            self.output_path,
+            stdin=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+    async def write_frame(self, frame: bytes):
+        """Writes exactly one output frame."""
+        self._proc.stdin.write(frame)
+        await self._proc.stdin.drain()
+        self.frames_written += 1
+        self._last_frame = frame
+
+    async def push_timed(self, frame: bytes, timestamp: float):
+        """
+        Adds a frame captured at `timestamp` (seconds). The screencast only emits a frame when the
+        page repaints, so the previous frame is repeated until the output clock catches up.
+        """
+        if self._start_ts is None:
+            self._start_ts = timestamp
+        due = int((timestamp - self._start_ts) * self.fps)
+        while self._last_frame is not None and self.frames_written < due:
+            await self.write_frame(self._last_frame)
+        await self.write_frame(frame)
+
+    async def finish(self, end_timestamp: float = None):
+        """Pads the tail with the last frame, closes the pipe and waits for ffmpeg."""
+        if end_timestamp is not None and self._start_ts is not None and self._last_frame is not None:
+            due = int((end_timestamp - self._start_ts) * self.fps)
+            while self.frames_written < due:
+                await self.write_frame(self._last_frame)
+        self._proc.stdin.close()
+        _, stderr = await self._proc.communicate()
+        if self._proc.returncode != 0:
+            raise Exception(f"ffmpeg failed to encode frames: {stderr.decode('utf8', errors='replace')}")
+        if self.frames_written == 0:
+            raise Exception("No frames were captured for this scene.")
+
+    async def abort(self):
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+            await self._proc.wait()
+
+
+async def _capture_screencast(page, sink: FrameSink, done_event: asyncio.Event):
+    """Streams CDP screencast frames into the sink until done_event is set."""
+    cdp = await page.context.new_cdp_session(page)
+    frames = asyncio.Queue()
+
+    def on_frame(params):
+        frames.put_nowait(params)
+        # Chrome stops sending frames until the previous one is acknowledged
+        asyncio.ensure_future(cdp.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]}))
+
+    cdp.on("Page.screencastFrame", on_frame)
+    await cdp.send("Page.startScreencast", {
+        "format": "jpeg",
+        "quality": 90,
+        "maxWidth": VIEWPORT['width'],
+        "maxHeight": VIEWPORT['height'],
+        "everyNthFrame": 1,
+    })
+
+    last_ts = None
+    try:
+        while not (done_event.is_set() and frames.empty()):
+            try:
+                params = await asyncio.wait_for(frames.get(), timeout=0.1)
+            except asyncio.TimeoutError:
+                continue
+            last_ts = params["metadata"]["timestamp"]
+            await sink.push_timed(base64.b64decode(params["data"]), last_ts)
+    finally:
+        try:
+            await cdp.send("Page.stopScreencast")
+            await cdp.detach()
+        except Exception:
+            pass
+    return last_ts
+
+
+async def _capture_virtual_time(page, sink: FrameSink, scene_id: str, max_seconds: float = MAX_SCENE_SECONDS):
+    """
+    Steps the page clock 1/fps at a time and screenshots after every step. Rendering takes as
+    long as the frames take to draw rather than as long as the animation is, and every run
+    produces the same frames.
+    """
+    step_ms = 1000.0 / sink.fps
+    max_frames = int(max_seconds * sink.fps)
+    for _ in range(max_frames):
+        complete = await page.evaluate("ms => window.__mtVirtualTime.advance(ms)", step_ms)
+        frame = await page.screenshot(type="jpeg", quality=90)
+        await sink.write_frame(frame)
+        if complete:
+            return
+    raise Exception(f"Scene {scene_id} did not signal completion within {max_seconds} virtual seconds.")
+
+
+async def render_scene_with_browser(animation_data: dict, output_dir: str, scene_id: str = None, fps: int = DEFAULT_FPS, virtual_time: bool = USE_VIRTUAL_TIME) -> str:
+    """
+    Renders a scene on a pooled headless browser page, capturing frames directly into ffmpeg.
+    The output lands at `<output_dir>/<scene_id>.mp4`, so concurrent scenes never collide.
+    With virtual_time the page clock is frame-stepped (deterministic, faster than real time);
+    otherwise the animation plays at wall-clock speed and is captured via screencast.
+    """
+    scene_id = scene_id or f"scene_{uuid.uuid4().hex[:8]}"
     output_path = os.path.join(output_dir, f"{scene_id}.mp4")
 
     print(f"  [Browser] Starting render for scene {scene_id}")
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        # Use a new context to enable video recording
-        context = await browser.new_context(
-            viewport={'width': 1280, 'height': 720},
-            record_video_dir=output_dir,
-            record_video_size={'width': 1280, 'height': 720}
-        )
-        
-        page = await context.new_page()
-
-        # Listen for the 'PAGE_READY' and 'ANIMATION_COMPLETE' signals
-        page_ready_event = asyncio.Event()
-        animation_complete_event = asyncio.Event()
-
-        def handle_console(msg):
-            if "---PAGE_READY---" in msg.text:
-                page_ready_event.set()
-            elif "---ANIMATION_COMPLETE---" in msg.text:
-                animation_complete_event.set()
-        
-        page.on('console', handle_console)
-
-        # Navigate to the local HTML file
-        await page.goto(f"file://{INDEX_HTML_PATH}")
-
-        # Wait for the page and PixiJS to be fully ready
-        await page_ready_event.wait()
-        print(f"  [Browser] Page is ready for scene {scene_id}")
-
-        # Execute the animation function in the browser's context
-        await page.evaluate(f"window.runAnimation({json.dumps(animation_data)})")
-
-        # Wait for the animation to signal its completion
-        await animation_complete_event.wait()
-        print(f"  [Browser] Animation complete for scene {scene_id}")
-
-        # Close the context to save the video
-        await context.close()
-        await browser.close()
-        
-        # Playwright saves with a random name, we need to find and rename it
-        video_files = [f for f in os.listdir(output_dir) if f.endswith('.webm')]
-        if video_files:
-            os.rename(os.path.join(output_dir, video_files[0]), output_path)
-            print(f"  [Browser] Scene rendered successfully: {output_path}")
-            return output_path
-        else:
-            raise Exception("Playwright did not save a video file.")
\ No newline at end of file
+    with timed_stage("browser_render", scene=scene_id):
+        async with browser_pool.page() as page:
+            # Listen for the 'PAGE_READY' and 'ANIMATION_COMPLETE' signals
+            page_ready_event = asyncio.Event()
+            animation_complete_event = asyncio.Event()
+            completed_at = {}
+
+            def handle_console(msg):
+                if "---PAGE_READY---" in msg.text:
+                    page_ready_event.set()
+                elif "---ANIMATION_COMPLETE---" in msg.text:
+                    # Screencast timestamps are wall-clock seconds, so the end of the clip is too
+                    completed_at.setdefault("ts", time.time())
+                    animation_complete_event.set()
+
+            page.on('console', handle_console)
+            sink = FrameSink(output_path, fps)
+            capture_task = None
+            try:
+                # Navigate to the local HTML file (a fresh load also resets a reused page)
+                await page.goto(f"file://{INDEX_HTML_PATH}")
+
+                # Wait for the page and PixiJS to be fully ready
+                await page_ready_event.wait()
+                print(f"  [Browser] Page is ready for scene {scene_id}")
+
+                await sink.start()
+                if virtual_time:
+                    # Freeze the clock before the animation starts, and don't await runAnimation's
+                    # promise: it can only resolve once we start advancing time.
+                    await page.evaluate("window.__mtVirtualTime.enable()")
+                    await page.evaluate(f"() => {{ window.runAnimation({json.dumps(animation_data)}); }}")
+                    await _capture_virtual_time(page, sink, scene_id)
+                    print(f"  [Browser] Animation complete for scene {scene_id}")
+                    await sink.finish()
+                else:
+                    capture_task = asyncio.create_task(_capture_screencast(page, sink, animation_complete_event))
+
+                    # Execute the animation function in the browser's context
+                    await page.evaluate(f"window.runAnimation({json.dumps(animation_data)})")
+
+                    # Wait for the animation to signal its completion
+                    await animation_complete_event.wait()
+                    print(f"  [Browser] Animation complete for scene {scene_id}")
+
+                    last_ts = await capture_task
+                    await sink.finish(end_timestamp=completed_at.get("ts", last_ts))
+            except BaseException:
+                if capture_task is not None and not capture_task.done():
+                    capture_task.cancel()
+                await sink.abort()
+                raise
+            finally:
+                page.remove_listener('console', handle_console)
+
+    print(f"  [Browser] Scene rendered successfully: {output_path} ({sink.frames_written} frames)")
+    return output_path
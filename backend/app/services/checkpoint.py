@@ -0,0 +1,220 @@
+# backend/app/services/checkpoint.py
+# Per-task manifest of finished pipeline stages, so a job interrupted by a crash or restart
+# picks up where it left off instead of re-planning and re-rendering everything.
+import os
+import json
+import time
+import fcntl
+import asyncio
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.services.workspace import STATE_FILE, CLAIM_FILE
+
+MANIFEST_FILE = "manifest.json"
+
+_claims: Dict[str, int] = {}
+_claims_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: str, payload: str):
+    # Write-then-rename so a crash mid-write leaves the previous manifest intact
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+class TaskManifest:
+    """
+    manifest.json in a task's workspace. Records the request, the storyboard, the master script and
+    every finished scene artifact (video and combined scene per quality, narration shared by all
+    qualities), plus stitched and uploaded outputs. Files are stored with their sha256 and only
+    reused if they still hash the same, so a half-written file is never picked up.
+    Hashing and saving happen in worker threads (the async methods), keeping the event loop free.
+    """
+
+    def __init__(self, path: str, data: dict, resumed: bool):
+        self.path = path
+        self.data = data
+        self.resumed = resumed
+        self._save_lock = asyncio.Lock()
+
+    @classmethod
+    def open(cls, workspace_path: str, task_id: str, request_data: dict) -> "TaskManifest":
+        """
+        Loads the task's manifest, or starts a fresh one if there is none or it was for a different request.
+        Blocking; call it from a worker thread (or a sync endpoint).
+        """
+        path = os.path.join(workspace_path, MANIFEST_FILE)
+        data = _read_manifest(path)
+        same_task = data is not None and data.get("task_id") == task_id and data.get("request") == request_data
+        # The manifest is first written when the job is accepted; it's only a resume once something was done
+        resumed = same_task and data.get("storyboard") is not None
+        if not same_task:
+            data = {
+                "task_id": task_id,
+                "request": request_data,
+                "status": "in_progress",
+                "created_at": time.time(),
+                "storyboard": None,
+                "master_script": None,
+                "scenes": {},
+                "outputs": {},
+                "uploads": {},
+            }
+        data["updated_at"] = time.time()
+        _write_atomic(path, json.dumps(data, indent=2))
+        return cls(path, data, resumed)
+
+    async def save(self):
+        # Serialized so an older snapshot can never be written after a newer one
+        async with self._save_lock:
+            self.data["updated_at"] = time.time()
+            payload = json.dumps(self.data, indent=2)
+            await asyncio.to_thread(_write_atomic, self.path, payload)
+
+    @staticmethod
+    def _entry(path: str) -> dict:
+        return {"path": os.path.abspath(path), "sha256": file_sha256(path), "bytes": os.path.getsize(path)}
+
+    @staticmethod
+    def _verify(entry: dict) -> Optional[str]:
+        if not os.path.isfile(entry["path"]):
+            return None
+        try:
+            if os.path.getsize(entry["path"]) != entry["bytes"] or file_sha256(entry["path"]) != entry["sha256"]:
+                return None
+        except OSError:
+            return None
+        return entry["path"]
+
+    async def _verified(self, entry: Optional[dict]) -> Optional[str]:
+        if not entry:
+            return None
+        return await asyncio.to_thread(self._verify, entry)
+
+    # --- Planning ---
+
+    @property
+    def storyboard(self) -> Optional[list]:
+        return self.data.get("storyboard")
+
+    async def record_storyboard(self, storyboard: list):
+        self.data["storyboard"] = storyboard
+        await self.save()
+
+    async def master_script(self) -> Optional[str]:
+        return await self._verified(self.data.get("master_script"))
+
+    async def record_master_script(self, path: str):
+        self.data["master_script"] = await asyncio.to_thread(self._entry, path)
+        await self.save()
+
+    # --- Scenes ---
+
+    async def scene_artifact(self, scene_num: int, kind: str, quality: str = None) -> Optional[str]:
+        """kind is "audio" (no quality), or "video"/"combined" for a quality tier."""
+        scene = self.data["scenes"].get(str(scene_num), {})
+        entry = scene.get(kind) if quality is None else scene.get(kind, {}).get(quality)
+        return await self._verified(entry)
+
+    async def record_scene_artifact(self, scene_num: int, kind: str, path: str, quality: str = None):
+        entry = await asyncio.to_thread(self._entry, path)
+        scene = self.data["scenes"].setdefault(str(scene_num), {})
+        if quality is None:
+            scene[kind] = entry
+        else:
+            scene.setdefault(kind, {})[quality] = entry
+        await self.save()
+
+    # --- Outputs ---
+
+    async def output(self, quality: str) -> Optional[str]:
+        return await self._verified(self.data["outputs"].get(quality))
+
+    async def record_output(self, quality: str, path: str):
+        self.data["outputs"][quality] = await asyncio.to_thread(self._entry, path)
+        await self.save()
+
+    def uploaded_url(self, quality: str) -> Optional[str]:
+        return self.data["uploads"].get(quality)
+
+    async def record_upload(self, quality: str, url: str):
+        self.data["uploads"][quality] = url
+        await self.save()
+
+    async def mark_complete(self):
+        self.data["status"] = "complete"
+        await self.save()
+
+
+def claim(task_id: str, workspace_path: str) -> bool:
+    """
+    Takes an exclusive lock on the task's workspace, so only one process sharing WORKSPACE_ROOT runs
+    (or resumes) it. The OS drops the lock when the holder dies, which is what makes a task
+    resumable. Returns False if another process holds it.
+    """
+    with _claims_lock:
+        if task_id in _claims:
+            return True
+        fd = os.open(os.path.join(workspace_path, CLAIM_FILE), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        _claims[task_id] = fd
+        return True
+
+
+def release_claim(task_id: str):
+    with _claims_lock:
+        fd = _claims.pop(task_id, None)
+    if fd is not None:
+        # Closing the descriptor drops the lock
+        os.close(fd)
+
+
+def find_resumable(root: str, max_age_seconds: float) -> List[Tuple[str, dict]]:
+    """
+    (task_id, request) for every workspace under root whose job was interrupted: it has an unfinished
+    manifest, was never released (released workspaces have a state file) and no live process holds
+    its claim. Each returned task is claimed for this process; release_claim() it when the job ends.
+    """
+    resumable = []
+    if not os.path.isdir(root):
+        return resumable
+    now = time.time()
+    for task_id in sorted(os.listdir(root)):
+        path = os.path.join(root, task_id)
+        if os.path.exists(os.path.join(path, STATE_FILE)):
+            continue
+        data = _read_manifest(os.path.join(path, MANIFEST_FILE))
+        if not data or data.get("status") != "in_progress" or data.get("task_id") != task_id:
+            continue
+        if now - data.get("updated_at", 0) > max_age_seconds:
+            print(f"  [Checkpoint] Not resuming {task_id}: last checkpoint is too old")
+            continue
+        if not claim(task_id, path):
+            # Still running in (or already resumed by) another process sharing this root
+            continue
+        resumable.append((task_id, data["request"]))
+    return resumable
@@ -2,20 +2,28 @@
 import os
 import uuid
 import subprocess
-from app.core.ai import model
+from app.core.ai import get_model
 import asyncio
-import grpc
-from google.api_core import exceptions as google_exceptions
 import re
 from pathlib import Path # <--- Import Pathlib for CWD change
+from app.core.quality import EncodingProfile, get_profile
+from app.core.metrics import timed_stage, record_failure
+from app.core.config import settings
+from app.services.processes import run_process
+
+# Scripts that pin their own quality would override the tier we pass on the command line
+QUALITY_OVERRIDE_PATTERN = re.compile(r'^config(\[["\'](quality|frame_rate|pixel_height|pixel_width)["\']\]|\.(quality|frame_rate|pixel_height|pixel_width))\s*=.*$', re.MULTILINE)
 
 async def call_gemini_with_backoff(messages, max_retries=7):
     # This function is correct.
     for attempt in range(max_retries):
         try:
-            response = await model.generate_content_async(messages)
+            response = await get_model().generate_content_async(
+                messages, request_options={"timeout": settings.PROVIDER_TIMEOUT_SECONDS}
+            )
             return response
         except Exception as e:
+            record_failure("gemini", e)
             print(f"  [API-CALL-ERROR] An unexpected error occurred: {e}")
             await asyncio.sleep(5)
     raise Exception("API call failed after multiple retries.")
@@ -36,7 +44,7 @@ You are a Manim code generator. Your ONLY job is to write simple, error-free Pyt
 4.  **CRITICAL BACKGROUND RULE**: For maximum visual variety, you MUST use a different background file (`bg1.png` to `bg5.png`) for each scene.
 5.  **CRITICAL TEXT COLOR RULE**: All `Text` objects MUST use dark, visible, but kid-friendly colors, such as dark pink (`#C71585`), deep red (`#8B0000`), or purple (`#800080`). **DO NOT** use light colors or plain black.
 6.  **CRITICAL POSITIONING RULE**: When placing objects (Text, ImageMobject), you MUST ensure they **NEVER** overlap or obstruct the character, text, or the main action. Use `to_corner(UP/DOWN/LEFT/RIGHT)` or `next_to` with generous spacing.
-7.  **VIDEO QUALITY RULE**: All Manim scenes MUST be rendered at 720p. You do this by setting the **`config["quality"] = "medium_quality"`** at the very top of the script.
+7.  **VIDEO QUALITY RULE**: DO NOT set `config["quality"]`, `config.frame_rate` or any resolution settings. The renderer picks the quality.
 8.  **BANNED CONSTANTS (CRITICAL!)**: You can ONLY use `UP`, `DOWN`, `LEFT`, `RIGHT`, `ORIGIN`.
     -   `CENTER` IS BANNED. `FRAME_CENTER` IS BANNED.
 8.  **GROUPING IS FIXED**: `Group` for `ImageMobject`, `VGroup` for `Text`.
@@ -47,7 +55,6 @@ You are a Manim code generator. Your ONLY job is to write simple, error-free Pyt
 ```python
 from manim import *
 
-config["quality"] = "medium_quality" # <-- NEW: Set 720p quality
 scene_state = {}
 
 class Scene1(Scene):
@@ -73,34 +80,37 @@ class Scene1(Scene):
 ```
 """
 
-def render_manim_script(script_path: str, output_dir: str, class_name: str):
+def render_manim_script(script_path: str, output_dir: str, class_name: str, profile: EncodingProfile = None):
     """
     Renders a SINGLE scene class from a script file, ensuring Manim runs from the correct directory.
+    The profile decides the manim quality flag and frame rate (defaults to the standard tier).
     """
+    profile = profile or get_profile()
     scene_id_for_path = f"{class_name}_{uuid.uuid4().hex[:4]}"
     
     backend_dir = Path(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
     # Manim command
-    command = ["manim", script_path, class_name, "-qm", "--media_dir", output_dir]
+    command = ["manim", script_path, class_name, profile.manim_flag, "--fps", str(profile.fps), "--media_dir", output_dir]
     
     try:
         # We run Manim, and the execution handles the file corruption and missing constant errors.
         # The key fix is forcing the AI to stop using the buggy constants and complex functions.
         print(f"  [Manim] Running from CWD: {backend_dir}")
         print(f"  [Manim] Rendering scene with command: {' '.join(command)}")
-        result = subprocess.run(
-            command, 
-            check=True, 
-            capture_output=True, 
-            text=True,
-            cwd=backend_dir
-        )
+        with timed_stage("manim_render", scene=class_name, quality=profile.name):
+            # run_process registers manim with the job, so cancelling the job kills it (and its ffmpeg)
+            result = run_process(
+                command, 
+                timeout=settings.SCENE_RENDER_TIMEOUT_SECONDS,
+                cwd=backend_dir
+            )
         
         script_file_name = os.path.splitext(os.path.basename(script_path))[0]
-        expected_video_path = os.path.join(output_dir, "videos", script_file_name, "720p30", f"{class_name}.mp4")
+        expected_video_path = os.path.join(output_dir, "videos", script_file_name, profile.manim_output_dir, f"{class_name}.mp4")
 
         if not os.path.exists(expected_video_path):
+             record_failure("manim_render", "missing_output")
              raise FileNotFoundError(f"Manim did not produce the expected video file at {expected_video_path}. Manim output: {result.stdout} {result.stderr}")
         
         final_video_path = os.path.join(output_dir, f"{scene_id_for_path}.mp4")
@@ -113,6 +123,10 @@ def render_manim_script(script_path: str, output_dir: str, class_name: str):
         error_message = f"Return Code: {e.returncode}\nSTDOUT: {e.stdout}\nSTDERR: {e.stderr}"
         print(f"  [Manim] --- MANIM RENDER FAILED ---\n{error_message}")
         return False, error_message
+    except subprocess.TimeoutExpired:
+        error_message = f"Manim was killed after {settings.SCENE_RENDER_TIMEOUT_SECONDS}s rendering {class_name}."
+        print(f"  [Manim] --- MANIM RENDER TIMED OUT ---\n{error_message}")
+        return False, error_message
     except Exception as e:
         print(f"  [Manim] --- An unexpected error occurred during render ---\n{e}")
         return False, str(e)
@@ -124,7 +138,8 @@ async def generate_manim_script(scene_description: str, output_dir: str) -> str:
     
     print(f"  [Manim-AI] Generating master script for all scenes...")
     try:
-        response = await call_gemini_with_backoff(messages)
+        with timed_stage("manim_script"):
+            response = await call_gemini_with_backoff(messages)
         raw_response_text = response.text.strip()
         code = raw_response_text
         if "```python" in code:
@@ -132,6 +147,7 @@ async def generate_manim_script(scene_description: str, output_dir: str) -> str:
             end = code.rfind("```")
             if end > start:
                 code = code[start:end]
+        code = QUALITY_OVERRIDE_PATTERN.sub("", code)
 
         script_id = f"master_script_{uuid.uuid4().hex[:8]}"
         script_path = os.path.join(output_dir, f"{script_id}.py")
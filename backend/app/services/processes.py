@@ -0,0 +1,96 @@
+# backend/app/services/processes.py
+# Tracks the child processes (manim, ffmpeg) each job starts, so a cancelled or timed-out job
+# can kill them instead of leaving them to burn CPU until they exit on their own.
+import os
+import time
+import signal
+import subprocess
+import threading
+import contextvars
+from typing import Dict, Set
+
+_current_job = contextvars.ContextVar("mathtoons_job", default=None)
+
+# Cancelled jobs are remembered (job_id -> when) so their leftover worker threads can't start new
+# children. Those threads end within the provider/scene timeouts, so an hour is plenty.
+CANCELLED_TTL_SECONDS = 3600
+
+_processes: Dict[str, Set[subprocess.Popen]] = {}
+_cancelled: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+class JobCancelledError(Exception):
+    """Raised when a cancelled job (or one of its leftover worker threads) tries to start a process."""
+
+
+def bind_job(job_id: str):
+    """Attributes every process started from this async context (and threads spawned via to_thread) to job_id."""
+    _current_job.set(job_id)
+
+
+def current_job():
+    return _current_job.get()
+
+
+def _kill_group(proc: subprocess.Popen):
+    # Each child runs in its own session, so this also takes out e.g. the ffmpeg that manim spawns
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_process(command: list, timeout: float = None, check: bool = True, **kwargs) -> subprocess.CompletedProcess:
+    """
+    subprocess.run() that registers the child with the current job so cancel_job() can kill it.
+    Output is captured as text, and a timeout kills the whole process group.
+    """
+    job_id = _current_job.get()
+    with _lock:
+        if job_id in _cancelled:
+            raise JobCancelledError(f"Job {job_id} was cancelled; not starting {command[0]}.")
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                start_new_session=True, **kwargs)
+        if job_id:
+            _processes.setdefault(job_id, set()).add(proc)
+    try:
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            stdout, stderr = proc.communicate()
+            raise subprocess.TimeoutExpired(command, timeout, output=stdout, stderr=stderr)
+    finally:
+        with _lock:
+            if job_id in _processes:
+                _processes[job_id].discard(proc)
+
+    if job_id in _cancelled:
+        raise JobCancelledError(f"Job {job_id} was cancelled while {command[0]} was running.")
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, command, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)
+
+
+def cancel_job(job_id: str) -> int:
+    """Kills every live child of the job and refuses new ones. Returns how many were killed."""
+    with _lock:
+        now = time.time()
+        for stale in [j for j, cancelled_at in _cancelled.items() if now - cancelled_at > CANCELLED_TTL_SECONDS]:
+            del _cancelled[stale]
+        _cancelled[job_id] = now
+        procs = list(_processes.pop(job_id, set()))
+    for proc in procs:
+        if proc.poll() is None:
+            _kill_group(proc)
+    if procs:
+        print(f"  [Processes] Killed {len(procs)} child process(es) of job {job_id}")
+    return len(procs)
+
+
+def forget_job(job_id: str):
+    """Drops bookkeeping for a finished job."""
+    with _lock:
+        _processes.pop(job_id, None)
+        _cancelled.pop(job_id, None)
@@ -3,6 +3,7 @@ import boto3
 import os
 import asyncio # New import for run_in_executor
 from app.core.config import settings
+from app.core.metrics import timed_stage, UPLOAD_BYTES
 from botocore.config import Config
 from urllib.parse import urlparse
 
@@ -36,19 +37,21 @@ async def upload_video_to_r2(local_file_path: str, destination_key: str) -> str:
         client = get_r2_client()
         
         loop = asyncio.get_running_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: client.upload_file(
-                Filename=local_file_path,
-                Bucket=settings.R2_BUCKET_NAME,
-                Key=destination_key,
-                # FIX: Removing 'ACL' as it's deprecated/problematic with R2. 
-                # Public access is enabled via your Cloudflare settings.
-                ExtraArgs={
-                    'ContentType': 'video/mp4'
-                }
+        with timed_stage("upload"):
+            await loop.run_in_executor(
+                None,
+                lambda: client.upload_file(
+                    Filename=local_file_path,
+                    Bucket=settings.R2_BUCKET_NAME,
+                    Key=destination_key,
+                    # FIX: Removing 'ACL' as it's deprecated/problematic with R2. 
+                    # Public access is enabled via your Cloudflare settings.
+                    ExtraArgs={
+                        'ContentType': 'video/mp4'
+                    }
+                )
             )
-        )
+        UPLOAD_BYTES.inc(os.path.getsize(local_file_path))
         
         # CRITICAL FIX: Construct the public URL using the public development URL you configured.
         # You need to manually find and set this in your environment variables:
@@ -2,15 +2,23 @@
 import os
 import uuid
 import asyncio
-from elevenlabs import save
-from elevenlabs.client import ElevenLabs
 from app.core.config import settings
+from app.core.metrics import timed_stage
+import subprocess
 import ffmpeg # We keep this for the 15% slowdown/speedup (15% slower = 0.85 atempo)
+from app.services.processes import run_process
 
-TEMP_ASSETS_DIR = "/tmp/math_toons_assets"
-os.makedirs(TEMP_ASSETS_DIR, exist_ok=True)
+_client = None
 
-client = ElevenLabs(api_key=settings.ELEVENLABS_API_KEY)
+
+def get_client():
+    """Builds the ElevenLabs client on first use so importing this module stays cheap."""
+    global _client
+    if _client is None:
+        from elevenlabs.client import ElevenLabs
+        # A hung request shouldn't hold a job (and its slot) forever
+        _client = ElevenLabs(api_key=settings.ELEVENLABS_API_KEY, timeout=settings.PROVIDER_TIMEOUT_SECONDS)
+    return _client
 
 # ElevenLabs voice map for multilingual
 # The 'Dora' voice is excellent for multilingual and sounds like a child host.
@@ -29,18 +37,19 @@ def _speed_adjust_audio(input_path: str, output_path: str, speed_factor: float):
     try:
         temp_output_path = f"{output_path}.temp.mp3"
         
-        (
+        run_process(
             ffmpeg
             .input(input_path)
             .filter('atempo', speed_factor) # Use speed_factor (0.85 for 15% slower)
             .output(temp_output_path, acodec='libmp3lame')
-            .run(overwrite_output=True, quiet=True)
+            .overwrite_output()
+            .compile()
         )
         os.replace(temp_output_path, output_path)
         print(f"  [TTS-FFmpeg] Successfully adjusted audio speed by factor {speed_factor}: {output_path}")
         
-    except ffmpeg.Error as e:
-        print(f"  [TTS-FFmpeg] Error adjusting audio speed: {e.stderr.decode('utf8')}")
+    except subprocess.CalledProcessError as e:
+        print(f"  [TTS-FFmpeg] Error adjusting audio speed: {e.stderr}")
         if os.path.exists(temp_output_path):
             os.remove(temp_output_path)
         raise
@@ -54,7 +63,9 @@ def _blocking_elevenlabs_tts(narration: str, final_output_path: str, lang: str):
     # 1. Generate the raw audio to a temp file
     temp_raw_audio_path = f"{final_output_path}.raw.mp3"
     
-    audio_stream = client.text_to_speech.convert(
+    from elevenlabs import save
+
+    audio_stream = get_client().text_to_speech.convert(
         text=narration,
         voice_id=voice_name,
         # eleven_multilingual_v2 is the best for Hindi/Marathi/English
@@ -84,13 +95,13 @@ async def generate_tts_audio(narration: str, character: str, output_dir: str, la
     audio_filename = f"scene_audio_{uuid.uuid4().hex[:8]}.mp3"
     output_path = os.path.join(output_dir, audio_filename)
     
-    loop = asyncio.get_running_loop()
-    
     try:
         # Pass the language code to the blocking function
-        await loop.run_in_executor(
-            None, _blocking_elevenlabs_tts, narration, output_path, lang
-        )
+        with timed_stage("tts", lang=lang):
+            # to_thread carries the job context, so the atempo ffmpeg is killed if the job is cancelled
+            await asyncio.to_thread(
+                _blocking_elevenlabs_tts, narration, output_path, lang
+            )
         
         if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
             raise FileNotFoundError("ElevenLabs TTS failed to create a valid audio file.")
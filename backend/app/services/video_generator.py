@@ -5,13 +5,22 @@ import uuid
 import asyncio
 import shutil
 from app.models.video import VideoGenerationRequest
-from app.core.ai import model
+from app.core.ai import get_model
 from app.core.config import settings
-from app.services.tts_generator import generate_tts_audio, TEMP_ASSETS_DIR
+from app.core.quality import EncodingProfile, get_profile
+from app.core import tracing
+from app.core.metrics import timed_stage, record_failure, SCENE_DURATION
+from app.services.tts_generator import generate_tts_audio
 from app.services.manim_generator import generate_manim_script, render_manim_script
 from app.services.video_stitcher import combine_scene_assets, stitch_final_video
 from app.services.storage_service import upload_video_to_r2 
+from app.services.workspace import Workspace, workspace_manager
+from app.services.checkpoint import TaskManifest
 from asyncio import Semaphore
+import time
+
+# Stands in for the student's name when a lesson is planned once for a whole class (see batch_generator.py)
+STUDENT_NAME_PLACEHOLDER = "__STUDENT__"
 
 # --- THE FINAL, "SHUT UP AND DO YOUR JOB" PROMPT (Manim Version) ---
 def create_storyboard_prompt(request: VideoGenerationRequest) -> str:
@@ -24,6 +33,11 @@ def create_storyboard_prompt(request: VideoGenerationRequest) -> str:
     student_name = request.student_name
     topic = request.topic
 
+    placeholder_rule = ""
+    if student_name == STUDENT_NAME_PLACEHOLDER:
+        placeholder_rule = f"""
+        9.  CRITICAL NAME RULE: The student name `{STUDENT_NAME_PLACEHOLDER}` is a placeholder that will be replaced later. Write it EXACTLY as `{STUDENT_NAME_PLACEHOLDER}` in every language and script. NEVER translate, transliterate or decorate it. Only mention the student in the scenes where it really matters (e.g. greeting, praise, goodbye)."""
+
     # This prompt is intentionally rude and robotic.
     prompt = f"""
         You are a JSON data generation bot. Your ONLY task is to take the following details and convert them into a valid JSON object.
@@ -43,7 +57,7 @@ def create_storyboard_prompt(request: VideoGenerationRequest) -> str:
         5.  CRITICAL PAUSING RULE: The narration MUST use three consecutive periods (`...`) to indicate a short, child-friendly pause, and MUST aim for 5-10 seconds of descriptive speech per scene.
         6.  CRITICAL LANGUAGE RULE: If the request language is 'hi' (Hindi) or 'mr' (Marathi), the entire `narration` MUST be written in the **Devanagari script**. If the language is 'en', use English.
         7.  The "scene_description" MUST be simple visual instructions for a Manim scene (these remain in English).
-        8.  DO NOT write any introductory text, explanations, or conversational replies like "Okay, I'm ready!". Your entire response must be ONLY the JSON.
+        8.  DO NOT write any introductory text, explanations, or conversational replies like "Okay, I'm ready!". Your entire response must be ONLY the JSON.{placeholder_rule}
 
         **JSON SCHEMA EXAMPLE (Hindi/Devanagari):**
         {{
@@ -68,13 +82,15 @@ async def generate_video_storyboard(request: VideoGenerationRequest) -> list:
         print("  [Orchestrator] Sending prompt to Gemini API for storyboard...")
         
         # NOTE: The rest of the function (response parsing) remains the same.
-        response = await model.generate_content_async(
-            prompt,
-            safety_settings={'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE',
-                             'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
-                             'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE',
-                             'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE'}
-        )
+        with timed_stage("storyboard"):
+            response = await get_model().generate_content_async(
+                prompt,
+                safety_settings={'HARM_CATEGORY_HARASSMENT': 'BLOCK_NONE',
+                                 'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_NONE',
+                                 'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_NONE',
+                                 'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_NONE'},
+                request_options={"timeout": settings.PROVIDER_TIMEOUT_SECONDS}
+            )
         
         if not response.parts:
             print("  [Orchestrator] !!! CRITICAL ERROR: Gemini API returned an empty response.")
@@ -91,6 +107,7 @@ async def generate_video_storyboard(request: VideoGenerationRequest) -> list:
         storyboard_data = json.loads(response_text)
         return storyboard_data.get("storyboard", [])
     except json.JSONDecodeError as e:
+        record_failure("storyboard", e)
         print(f"  [Orchestrator] !!! CRITICAL JSON DECODE ERROR: The AI did not return valid JSON.")
         print(f"  [Orchestrator] The invalid text from the API was: {response.text}")
         raise ValueError(f"Failed to decode JSON from AI. Invalid text: {response.text}")
@@ -98,40 +115,93 @@ async def generate_video_storyboard(request: VideoGenerationRequest) -> list:
         print(f"  [Orchestrator] An error occurred while generating storyboard: {e}")
         raise
 
-async def create_personalized_video(request: VideoGenerationRequest):
-    task_id = uuid.uuid4().hex
-    output_dir = os.path.join(TEMP_ASSETS_DIR, task_id)
-    os.makedirs(output_dir, exist_ok=True)
-    
-    print(f"[Orchestrator] Starting video generation task {task_id} for {request.student_name}")
-    
-    final_video_path = None
-    final_video_url = None
-    
-    try:
+async def _done(value):
+    return value
+
+
+async def plan_video(request: VideoGenerationRequest, workspace: Workspace, manifest: TaskManifest = None):
+    """
+    Runs the two Gemini calls (storyboard + master Manim script). Done once per task, whatever the quality.
+    With a manifest, whatever was already planned is reused and new results are checkpointed.
+    """
+    storyboard = manifest.storyboard if manifest else None
+    if storyboard:
+        print("  [Orchestrator] Reusing the checkpointed storyboard.")
+    else:
         storyboard = await generate_video_storyboard(request)
         if not storyboard:
             raise ValueError("Storyboard generation failed or returned empty.")
+        if manifest:
+            await manifest.record_storyboard(storyboard)
 
-        full_scene_description = "\n\n".join([f"**Scene {s['scene_number']} Description:**\n{s['scene_description']}" for s in storyboard])
-        master_script_path = await generate_manim_script(full_scene_description, output_dir)
-        
-        successful_assets = []
-        concurrency_limit = 1 
-        semaphore = Semaphore(concurrency_limit)
-        
-        async def render_and_tts_for_scene(scene_data):
-            async with semaphore:
-                scene_num = scene_data['scene_number']
-                class_name = f"Scene{scene_num}"
-                print(f"  [Orchestrator] Processing Scene {scene_num} ({class_name})")
-                
-                loop = asyncio.get_running_loop()
-                
-                render_task = loop.run_in_executor(
-                    None, render_manim_script, master_script_path, output_dir, class_name
+    master_script_path = await manifest.master_script() if manifest else None
+    if master_script_path:
+        print("  [Orchestrator] Reusing the checkpointed master script.")
+        return storyboard, master_script_path
+
+    full_scene_description = "\n\n".join([f"**Scene {s['scene_number']} Description:**\n{s['scene_description']}" for s in storyboard])
+    if request.student_name == STUDENT_NAME_PLACEHOLDER:
+        full_scene_description += f"\n\n**NOTE:** `{STUDENT_NAME_PLACEHOLDER}` is a placeholder for the student's name. Copy it into Text() EXACTLY as written."
+    master_script_path = await generate_manim_script(full_scene_description, workspace.path)
+    if manifest:
+        await manifest.record_master_script(master_script_path)
+    return storyboard, master_script_path
+
+
+async def render_video(request: VideoGenerationRequest, storyboard: list, master_script_path: str, workspace: Workspace, profile: EncodingProfile, audio_paths: dict, manifest: TaskManifest = None) -> str:
+    """
+    Renders, combines and stitches every scene at the given profile and returns the local video path.
+    `audio_paths` maps scene_number -> narration mp3; scenes already in it reuse their audio, so a
+    preview and a final render of the same task only pay for TTS once.
+    Intermediates go to the workspace's scratch dir; the stitched video goes to its durable path.
+    With a manifest, checkpointed scene videos, narrations and combined scenes are reused and every
+    new one is checkpointed as soon as it's done.
+    """
+    if manifest:
+        stitched_path = await manifest.output(profile.name)
+        if stitched_path:
+            print(f"  [Orchestrator] Reusing the checkpointed {profile.name} video.")
+            return stitched_path
+
+    async def checkpointed(scene_num, kind, quality=None):
+        return await manifest.scene_artifact(scene_num, kind, quality) if manifest else None
+
+    output_dir = workspace.scratch
+    successful_assets = []
+    concurrency_limit = 1 
+    semaphore = Semaphore(concurrency_limit)
+    
+    async def render_and_tts_for_scene(scene_data):
+        async with semaphore:
+            scene_num = scene_data['scene_number']
+            class_name = f"Scene{scene_num}"
+            print(f"  [Orchestrator] Processing Scene {scene_num} ({class_name}) at {profile.name} quality")
+            # Each scene gets its own row in the task trace
+            tracing.set_lane(f"scene {scene_num}")
+            scene_started = time.perf_counter()
+
+            combined_path = await checkpointed(scene_num, "combined", profile.name)
+            if combined_path:
+                print(f"  [Orchestrator] Scene {scene_num}: reusing the checkpointed combined scene.")
+                return scene_num, None, None, combined_path
+            if scene_num not in audio_paths:
+                cached_audio = await checkpointed(scene_num, "audio")
+                if cached_audio:
+                    audio_paths[scene_num] = cached_audio
+            cached_video = await checkpointed(scene_num, "video", profile.name)
+
+            if cached_video:
+                render_task = _done((True, cached_video))
+            else:
+                # to_thread (unlike run_in_executor) carries the trace context into the worker thread
+                render_task = asyncio.to_thread(
+                    render_manim_script, master_script_path, output_dir, class_name, profile
                 )
-                
+            
+            if scene_num in audio_paths:
+                render_result = await render_task
+                audio_path = audio_paths[scene_num]
+            else:
                 # We need to pass the language ('lang') from the request to the TTS generator
                 tts_task = generate_tts_audio(
                     scene_data['narration'], 
@@ -141,53 +211,117 @@ async def create_personalized_video(request: VideoGenerationRequest):
                 ) 
                 
                 render_result, audio_path = await asyncio.gather(render_task, tts_task, return_exceptions=False)
-                
-                render_success, video_path_or_error = render_result
+                audio_paths[scene_num] = audio_path
+                if manifest:
+                    await manifest.record_scene_artifact(scene_num, "audio", audio_path)
+            
+            render_success, video_path_or_error = render_result
 
-                if not render_success:
-                    raise Exception(f"Failed to render scene {scene_num}: {video_path_or_error}")
-                
-                return video_path_or_error, audio_path
+            if not render_success:
+                raise Exception(f"Failed to render scene {scene_num}: {video_path_or_error}")
+            if manifest and not cached_video:
+                await manifest.record_scene_artifact(scene_num, "video", video_path_or_error, profile.name)
+            
+            SCENE_DURATION.observe(time.perf_counter() - scene_started, quality=profile.name)
+            return scene_num, video_path_or_error, audio_path, None
 
-        tasks = [render_and_tts_for_scene(scene) for scene in storyboard]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                print(f"  [Orchestrator] !!! WARNING: Scene {i+1} failed to process and will be SKIPPED. Error: {result}")
-            else:
-                successful_assets.append(result)
-        
-        if not successful_assets:
-            raise Exception("All scenes failed to generate. No video can be created.")
+    tasks = [render_and_tts_for_scene(scene) for scene in storyboard]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            print(f"  [Orchestrator] !!! WARNING: Scene {i+1} failed to process and will be SKIPPED. Error: {result}")
+        else:
+            successful_assets.append(result)
+    
+    if not successful_assets:
+        raise Exception("All scenes failed to generate. No video can be created.")
 
-        print(f"  [Orchestrator] {len(successful_assets)}/{len(storyboard)} scenes generated successfully.")
+    print(f"  [Orchestrator] {len(successful_assets)}/{len(storyboard)} scenes generated successfully.")
 
-        loop = asyncio.get_running_loop()
-        combined_scene_paths = []
-        for video_path, audio_path in successful_assets:
-            combined_path = await loop.run_in_executor(
-                None, combine_scene_assets, video_path, audio_path, output_dir
+    combined_scene_paths = []
+    for scene_num, video_path, audio_path, combined_path in successful_assets:
+        if combined_path is None:
+            combined_path = await asyncio.to_thread(
+                combine_scene_assets, video_path, audio_path, output_dir, profile
             )
-            if combined_path:
-                combined_scene_paths.append(combined_path)
+            if combined_path and manifest:
+                await manifest.record_scene_artifact(scene_num, "combined", combined_path, profile.name)
+        if combined_path:
+            combined_scene_paths.append(combined_path)
 
-        if not combined_scene_paths:
-             raise Exception("All scenes failed to combine. No video can be created.")
+    if not combined_scene_paths:
+         raise Exception("All scenes failed to combine. No video can be created.")
 
-        final_video_path = await loop.run_in_executor(
-            None, stitch_final_video, combined_scene_paths, output_dir
-        )
-        
-        # --- NEW: Upload to R2 and get public URL ---
-        video_key = f"{request.student_name.lower().replace(' ', '_')}/{task_id}.mp4"
-        
-        uploaded_key = await upload_video_to_r2(final_video_path, video_key)
-        # CRITICAL FIX: Assemble the final public URL
-        if settings.R2_PUBLIC_URL_BASE:
-            final_video_url = f"{settings.R2_PUBLIC_URL_BASE.rstrip('/')}/{uploaded_key}"
-        else:
-            final_video_url = f"R2 Upload Successful: Missing R2_PUBLIC_URL_BASE to create final link. Key: {uploaded_key}"
+    stitched_path = await asyncio.to_thread(
+        stitch_final_video, combined_scene_paths, workspace.path, profile
+    )
+    if manifest:
+        await manifest.record_output(profile.name, stitched_path)
+    return stitched_path
+
+
+async def upload_and_build_url(local_path: str, video_key: str) -> str:
+    """Uploads a finished video to R2 and assembles its public URL."""
+    uploaded_key = await upload_video_to_r2(local_path, video_key)
+    # CRITICAL FIX: Assemble the final public URL
+    if settings.R2_PUBLIC_URL_BASE:
+        return f"{settings.R2_PUBLIC_URL_BASE.rstrip('/')}/{uploaded_key}"
+    return f"R2 Upload Successful: Missing R2_PUBLIC_URL_BASE to create final link. Key: {uploaded_key}"
+
+
+async def create_personalized_video(request: VideoGenerationRequest, on_preview=None, task_id: str = None):
+    """
+    Plans, renders and uploads a video at the requested quality tier.
+    If request.preview_first is set, a preview-tier render is uploaded first and its URL handed to
+    the async `on_preview(url)` callback before the full-quality render starts.
+    """
+    task_id = task_id or uuid.uuid4().hex
+    workspace = workspace_manager.allocate(task_id)
+    # Reopens the checkpoint of an interrupted or re-delivered run of this task, if there is one
+    manifest = await asyncio.to_thread(TaskManifest.open, workspace.path, task_id, request.dict())
+    tracing.start_trace(task_id)
+    
+    print(f"[Orchestrator] Starting video generation task {task_id} for {request.student_name} ({request.quality} quality)")
+    if manifest.resumed:
+        print(f"[Orchestrator] Resuming task {task_id} from its checkpoint")
+    
+    final_video_path = None
+    final_video_url = None
+    student_slug = request.student_name.lower().replace(' ', '_')
+    
+    try:
+        with timed_stage("pipeline", quality=request.quality):
+            with tracing.span("plan"):
+                storyboard, master_script_path = await plan_video(request, workspace, manifest)
+            audio_paths = {}
+
+            if request.preview_first and request.quality != "preview":
+                # A failed preview shouldn't cost the teacher their final video
+                try:
+                    preview_url = manifest.uploaded_url("preview")
+                    if not preview_url:
+                        # Not "render": admission ETAs should only time the requested tier
+                        with tracing.span("preview_render"):
+                            preview_path = await render_video(request, storyboard, master_script_path, workspace, get_profile("preview"), audio_paths, manifest)
+                        preview_url = await upload_and_build_url(preview_path, f"{student_slug}/{task_id}_preview.mp4")
+                        await manifest.record_upload("preview", preview_url)
+                    print(f"  [Orchestrator] Preview uploaded: {preview_url}")
+                    if on_preview:
+                        await on_preview(preview_url)
+                except Exception as e:
+                    record_failure("preview", e)
+                    print(f"  [Orchestrator] !!! WARNING: Preview render failed, continuing with the full render. Error: {e}")
+
+            final_video_url = manifest.uploaded_url(request.quality)
+            if not final_video_url:
+                with tracing.span("render", quality=request.quality):
+                    final_video_path = await render_video(request, storyboard, master_script_path, workspace, get_profile(request.quality), audio_paths, manifest)
+                
+                # --- NEW: Upload to R2 and get public URL ---
+                final_video_url = await upload_and_build_url(final_video_path, f"{student_slug}/{task_id}.mp4")
+                await manifest.record_upload(request.quality, final_video_url)
+            await manifest.mark_complete()
             
         print(f"--- ✅ ✅ ✅ SUCCESS! ✅ ✅ ✅ ---")
         print(f"  [Orchestrator] Final video created and uploaded. Public URL: {final_video_url}")
@@ -198,5 +332,5 @@ async def create_personalized_video(request: VideoGenerationRequest):
         print(f"  [Orchestrator] A critical error occurred during video generation: {e}")
         return None # Return None on failure
     finally:
-        # shutil.rmtree(output_dir, ignore_errors=True)
-        pass
\ No newline at end of file
+        # Successful tasks are wiped right away; failed ones are kept for the debug window
+        workspace_manager.release(task_id, success=final_video_url is not None)
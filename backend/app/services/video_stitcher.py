@@ -2,8 +2,10 @@
 import os
 import uuid
 import ffmpeg
-from moviepy import VideoFileClip, AudioFileClip, concatenate_videoclips
 import random # <-- NEW IMPORT
+from app.core.quality import EncodingProfile, get_profile
+from app.core.metrics import timed_stage
+from app.services.processes import run_process
 
 def get_stream_duration(stream_path: str, stream_type: str) -> float:
     """Get the duration of a specific stream type from a file using ffprobe."""
@@ -11,6 +13,7 @@ def get_stream_duration(stream_path: str, stream_type: str) -> float:
         # NOTE: moviepy's AudioFileClip is more resilient for formats like MP3/AIFF/WAV
         # We will use that for duration calculation to avoid edge cases.
         if stream_type == 'audio':
+            from moviepy import AudioFileClip  # MoviePy is slow to import; only workers need it
             clip = AudioFileClip(stream_path)
             duration = clip.duration
             clip.close()
@@ -23,8 +26,10 @@ def get_stream_duration(stream_path: str, stream_type: str) -> float:
         print(f"  [Stitcher-FFmpeg] Error getting {stream_type} duration for {stream_path}: {e}")
         return 0
 
-def combine_scene_assets(video_path: str, audio_path: str, output_dir: str) -> str:
+@timed_stage("combine")
+def combine_scene_assets(video_path: str, audio_path: str, output_dir: str, profile: EncodingProfile = None) -> str:
     """Combines video and audio using ffmpeg-python. This is ROCK SOLID."""
+    profile = profile or get_profile()
     print(f"  [Stitcher-FFmpeg] Combining scene: {os.path.basename(video_path)} + {os.path.basename(audio_path)}")
     output_filename = f"combined_scene_{uuid.uuid4().hex[:8]}.mp4"
     output_path = os.path.join(output_dir, output_filename)
@@ -39,10 +44,16 @@ def combine_scene_assets(video_path: str, audio_path: str, output_dir: str) -> s
         if audio_duration > video_duration:
             video_input = video_input.filter('tpad', stop_mode='clone', stop_duration=(audio_duration - video_duration))
 
-        (
+        run_process(
             ffmpeg
-            .output(video_input, audio_input, output_path, vcodec='libx264', acodec='aac', shortest=None, t=audio_duration)
-            .run(quiet=True, overwrite_output=True)
+            .output(
+                video_input, audio_input, output_path,
+                vcodec='libx264', preset=profile.x264_preset, crf=profile.crf, r=profile.fps,
+                acodec='aac', audio_bitrate=profile.audio_bitrate,
+                shortest=None, t=audio_duration
+            )
+            .overwrite_output()
+            .compile()
         )
         
         print(f"  [Stitcher-FFmpeg] Scene combined successfully: {output_path}")
@@ -52,24 +63,36 @@ def combine_scene_assets(video_path: str, audio_path: str, output_dir: str) -> s
         print(f"  [Stitcher-FFmpeg] Error combining scene assets: {e}")
         raise
 
-def stitch_final_video(scene_paths: list, output_dir: str) -> str:
+@timed_stage("stitch")
+def stitch_final_video(scene_paths: list, output_dir: str, profile: EncodingProfile = None) -> str:
     """Concatenates scenes and then uses ffmpeg to add background music."""
     if not scene_paths:
         raise ValueError("Cannot stitch video, no scene paths provided.")
+    profile = profile or get_profile()
         
-    print(f"  [Stitcher] Stitching {len(scene_paths)} scenes into final video...")
+    print(f"  [Stitcher] Stitching {len(scene_paths)} scenes into final video ({profile.name} quality)...")
     
     intermediate_video_path = os.path.join(output_dir, f"intermediate_{uuid.uuid4().hex[:8]}.mp4")
-    output_path = os.path.join(output_dir, "final_video.mp4")
-    
-    clips = [VideoFileClip(path) for path in scene_paths]
-    final_clip = concatenate_videoclips(clips, method="compose")
+    # One file per tier, so a preview and a final render of the same task can coexist
+    output_path = os.path.join(output_dir, f"final_video_{profile.name}.mp4")
     
-    final_clip.write_videofile(intermediate_video_path, codec="libx264", audio_codec="aac", logger=None)
-    
-    for clip in clips:
-        clip.close()
-    final_clip.close()
+    # Every combined scene was encoded with the same profile (codec, size, fps, audio), so they can be
+    # joined with the concat demuxer without re-encoding. Going through run_process (instead of
+    # MoviePy's own ffmpeg) also lets a cancelled job kill it.
+    concat_list_path = os.path.join(output_dir, f"concat_{uuid.uuid4().hex[:8]}.txt")
+    with open(concat_list_path, "w") as f:
+        for path in scene_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        run_process([
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", concat_list_path,
+            "-c", "copy", "-movflags", "+faststart",
+            intermediate_video_path
+        ])
+    finally:
+        os.remove(concat_list_path)
 
     # --- UPDATED MUSIC LOGIC ---
     music_options = ["assets/music/mu1.mp3", "assets/music/mu2.mp3"]
@@ -88,10 +111,11 @@ def stitch_final_video(scene_paths: list, output_dir: str) -> str:
             bg_music = bg_music.filter('volume', 0.22)
             mixed_audio = ffmpeg.filter([main_audio, bg_music], 'amix', duration='first', dropout_transition=1)
 
-            (
+            run_process(
                 ffmpeg
-                .output(video_input['v'], mixed_audio, output_path, vcodec='copy', acodec='aac')
-                .run(quiet=True, overwrite_output=True)
+                .output(video_input['v'], mixed_audio, output_path, vcodec='copy', acodec='aac', audio_bitrate=profile.audio_bitrate)
+                .overwrite_output()
+                .compile()
             )
             os.remove(intermediate_video_path)
             
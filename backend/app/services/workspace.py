@@ -0,0 +1,333 @@
+# backend/app/services/workspace.py
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+STATE_FILE = ".workspace_state"
+# flock'ed by the process running the task (see checkpoint.claim())
+CLAIM_FILE = ".claim"
+TOMBSTONE_MARKER = ".deleting-"
+
+
+@dataclass
+class Workspace:
+    """
+    The directories a single task writes into.
+    `path` holds the durable files (master script, final video); `scratch` holds the hot
+    intermediates (Manim media, audio, combined scenes) and lives on tmpfs when one is configured.
+    """
+    task_id: str
+    path: str
+    scratch: str
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    state: str = "active"  # active | failed | interrupted
+    released_at: Optional[float] = None
+
+    def touch(self):
+        self.last_used = time.time()
+
+
+def _detach_files(ws: Workspace) -> list:
+    """
+    Renames a workspace's dirs aside so they can be deleted without holding the manager lock
+    (and without racing a re-allocation of the same task). Returns the paths to delete.
+    """
+    doomed = []
+    for path in {ws.path, ws.scratch}:
+        tombstone = f"{path}{TOMBSTONE_MARKER}{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(path, tombstone)
+            doomed.append(tombstone)
+        except OSError:
+            pass
+    return doomed
+
+
+def _delete_paths(paths: list):
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _delete_in_background(paths: list):
+    """Deletes detached dirs on a worker thread, so callers on the event loop don't wait on rmtree."""
+    if paths:
+        threading.Thread(target=_delete_paths, args=(paths,), name="workspace-delete", daemon=True).start()
+
+
+@contextmanager
+def _hold_claim(ws: Workspace):
+    """
+    Takes the task's claim lock (see checkpoint.claim) without waiting and holds it for the block, so
+    no other process sharing the root can claim the workspace while it's being retired.
+    Yields False if someone else holds it, i.e. the task is running or being resumed elsewhere.
+    """
+    try:
+        fd = os.open(os.path.join(ws.path, CLAIM_FILE), os.O_RDWR)
+    except OSError:
+        # Never claimed, or already gone
+        yield True
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        os.close(fd)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class WorkspaceManager:
+    """
+    Allocates per-task directories and keeps the render host's disk in check.
+    - Successful tasks are deleted as soon as they're released.
+    - Failed tasks are kept for `failed_retention_seconds` so they can be debugged.
+    - When total usage goes over `quota_bytes`, inactive workspaces are evicted least-recently-used first.
+      Active workspaces are never evicted, nor are interrupted ones (left unreleased by a process
+      that died) while their job may still be resumed.
+    Measuring usage means walking every workspace (Manim media trees included), so allocate() only
+    kicks off a sweep on a background thread instead of doing it inline.
+    """
+
+    def __init__(self, root: str, quota_bytes: int, failed_retention_seconds: int,
+                 tmpfs_dir: Optional[str] = None, tmpfs_quota_bytes: int = 0, resume_window_seconds: int = 0):
+        self.root = os.path.abspath(root)
+        self.tmpfs_dir = os.path.abspath(tmpfs_dir) if tmpfs_dir else None
+        self.quota_bytes = quota_bytes
+        self.tmpfs_quota_bytes = tmpfs_quota_bytes
+        self.failed_retention_seconds = failed_retention_seconds
+        self.resume_window_seconds = resume_window_seconds
+        self._workspaces: Dict[str, Workspace] = {}
+        self._lock = threading.RLock()
+        # Held for a whole sweep so only one runs at a time; _lock is only held for bookkeeping
+        self._sweep_lock = threading.Lock()
+        self._scanned = False
+        # tmpfs usage as of the last sweep, so allocate() doesn't have to walk tmpfs itself
+        self._tmpfs_used = 0
+
+    def _scan(self):
+        """Picks up workspaces left behind by a previous process so they count towards the quota."""
+        if self._scanned:
+            return
+        self._scanned = True
+        os.makedirs(self.root, exist_ok=True)
+        task_ids = set(os.listdir(self.root))
+        if self.tmpfs_dir and os.path.isdir(self.tmpfs_dir):
+            task_ids.update(os.listdir(self.tmpfs_dir))
+        leftovers = []
+        for task_id in task_ids:
+            path = os.path.join(self.root, task_id)
+            if TOMBSTONE_MARKER in task_id:
+                # Detached by a process that died before deleting it
+                leftovers.append(path)
+                if self.tmpfs_dir:
+                    leftovers.append(os.path.join(self.tmpfs_dir, task_id))
+                continue
+            if task_id in self._workspaces:
+                continue
+            if not os.path.isdir(path):
+                if not (self.tmpfs_dir and os.path.isdir(os.path.join(self.tmpfs_dir, task_id))):
+                    continue
+                os.makedirs(path, exist_ok=True)
+            scratch = path
+            if self.tmpfs_dir and os.path.isdir(os.path.join(self.tmpfs_dir, task_id)):
+                scratch = os.path.join(self.tmpfs_dir, task_id)
+            released_at = os.path.getmtime(path)
+            # Released workspaces have a state file. One without it was still in use when its process
+            # died (or belongs to another live process sharing the root), so its job may be resumed.
+            state = "interrupted"
+            try:
+                with open(os.path.join(path, STATE_FILE)) as f:
+                    released_at = json.load(f).get("released_at", released_at)
+                state = "failed"
+            except (OSError, ValueError):
+                pass
+            ws = Workspace(task_id, path, scratch, created_at=released_at,
+                           last_used=released_at, state=state, released_at=released_at)
+            if state == "failed":
+                with _hold_claim(ws) as unclaimed:
+                    if not unclaimed:
+                        # Another process picked it up again since: not ours to retire
+                        ws.state = "interrupted"
+            self._workspaces[task_id] = ws
+        _delete_in_background(leftovers)
+
+    def _remove(self, ws: Workspace):
+        self._workspaces.pop(ws.task_id, None)
+        _delete_in_background(_detach_files(ws))
+
+    def sweep(self):
+        """
+        Drops expired failed workspaces, then evicts inactive ones (LRU) until under quota.
+        Sizes are measured without holding the manager lock, so allocate() never waits on the disk walk.
+        """
+        with self._sweep_lock:
+            doomed = []
+            with self._lock:
+                self._scan()
+                now = time.time()
+                for ws in list(self._workspaces.values()):
+                    if ws.state == "active":
+                        continue
+                    # A workspace another process sharing the root has claimed (running or resuming it)
+                    # is left alone, whatever it looked like when we scanned it
+                    with _hold_claim(ws) as unclaimed:
+                        if not unclaimed:
+                            continue
+                        if ws.state == "interrupted" and now - (ws.released_at or now) > self.resume_window_seconds:
+                            # Nobody resumed it in time: it's just a failed run now
+                            ws.state = "failed"
+                        if ws.state == "failed" and now - (ws.released_at or now) > self.failed_retention_seconds:
+                            print(f"  [Workspace] Debug window expired, removing {ws.task_id}")
+                            self._workspaces.pop(ws.task_id, None)
+                            doomed += _detach_files(ws)
+                snapshot = list(self._workspaces.values())
+
+            sizes, tmpfs_used = {}, 0
+            for ws in snapshot:
+                scratch_size = _dir_size(ws.scratch) if ws.scratch != ws.path else 0
+                sizes[ws.task_id] = _dir_size(ws.path) + scratch_size
+                tmpfs_used += scratch_size
+            total = sum(sizes.values())
+
+            with self._lock:
+                self._tmpfs_used = tmpfs_used
+                if total > self.quota_bytes:
+                    # Re-checked under the lock: a workspace may have been re-allocated while we were measuring
+                    # Interrupted workspaces are kept until their job is resumed (or the resume window passes)
+                    inactive = sorted((ws for ws in self._workspaces.values() if ws.state == "failed" and ws.task_id in sizes),
+                                      key=lambda w: w.last_used)
+                    for ws in inactive:
+                        if total <= self.quota_bytes:
+                            break
+                        with _hold_claim(ws) as unclaimed:
+                            if not unclaimed:
+                                continue
+                            print(f"  [Workspace] Over quota ({total} > {self.quota_bytes} bytes), evicting {ws.task_id}")
+                            total -= sizes[ws.task_id]
+                            self._workspaces.pop(ws.task_id, None)
+                            doomed += _detach_files(ws)
+            _delete_paths(doomed)
+            if total > self.quota_bytes:
+                print(f"  [Workspace] !!! WARNING: Active and interrupted workspaces alone use {total} bytes, above the {self.quota_bytes} byte quota.")
+
+    def request_sweep(self):
+        """Runs sweep() on a background thread, unless one is already running."""
+        if self._sweep_lock.locked():
+            return
+        threading.Thread(target=self.sweep, name="workspace-sweep", daemon=True).start()
+
+    def allocate(self, task_id: str) -> Workspace:
+        """Creates (or re-opens) the workspace for a task and marks it active."""
+        with self._lock:
+            self._scan()
+            ws = self._workspaces.get(task_id)
+            if ws is None:
+                path = os.path.join(self.root, task_id)
+                scratch = path
+                # Hot files go to RAM only while there's room for them
+                if self.tmpfs_dir and self._tmpfs_used < self.tmpfs_quota_bytes:
+                    scratch = os.path.join(self.tmpfs_dir, task_id)
+                ws = Workspace(task_id, path, scratch)
+                self._workspaces[task_id] = ws
+            ws.state = "active"
+            ws.released_at = None
+            ws.touch()
+            os.makedirs(ws.path, exist_ok=True)
+            os.makedirs(ws.scratch, exist_ok=True)
+            try:
+                os.remove(os.path.join(ws.path, STATE_FILE))
+            except OSError:
+                pass
+        # A new job is about to write: make room in the background
+        self.request_sweep()
+        return ws
+
+    def release(self, task_id: str, success: bool):
+        """Deletes a finished task's files, or keeps a failed one around for the debug window."""
+        with self._lock:
+            ws = self._workspaces.get(task_id)
+            if ws is None:
+                return
+            if success or self.failed_retention_seconds <= 0:
+                self._remove(ws)
+                return
+            ws.state = "failed"
+            ws.released_at = time.time()
+            ws.touch()
+            try:
+                with open(os.path.join(ws.path, STATE_FILE), "w") as f:
+                    json.dump({"state": "failed", "released_at": ws.released_at}, f)
+            except OSError:
+                pass
+            print(f"  [Workspace] Keeping failed workspace {task_id} for {self.failed_retention_seconds}s: {ws.path}")
+
+    def discard(self, task_id: str):
+        """Deletes a workspace right away, whatever its state (used for cancelled and timed-out jobs)."""
+        with self._lock:
+            ws = self._workspaces.get(task_id)
+            if ws is not None:
+                self._remove(ws)
+
+    def usage(self) -> dict:
+        """Current disk usage, broken down per workspace. Walks the disk, so don't call it from the event loop."""
+        self.sweep()
+        with self._lock:
+            snapshot = sorted(self._workspaces.values(), key=lambda w: w.last_used, reverse=True)
+        # Measured without the lock, like in sweep()
+        workspaces, tmpfs_used = [], 0
+        for ws in snapshot:
+            on_tmpfs = ws.scratch != ws.path
+            scratch_size = _dir_size(ws.scratch) if on_tmpfs else 0
+            tmpfs_used += scratch_size
+            workspaces.append({
+                "task_id": ws.task_id,
+                "state": ws.state,
+                "bytes": _dir_size(ws.path) + scratch_size,
+                "on_tmpfs": on_tmpfs,
+                "last_used": ws.last_used,
+            })
+        return {
+            "root": self.root,
+            "tmpfs_dir": self.tmpfs_dir,
+            "quota_bytes": self.quota_bytes,
+            "used_bytes": sum(w["bytes"] for w in workspaces),
+            "tmpfs_used_bytes": tmpfs_used,
+            "active": sum(1 for w in workspaces if w["state"] == "active"),
+            "failed": sum(1 for w in workspaces if w["state"] == "failed"),
+            "interrupted": sum(1 for w in workspaces if w["state"] == "interrupted"),
+            "workspaces": workspaces,
+        }
+
+
+workspace_manager = WorkspaceManager(
+    root=settings.WORKSPACE_ROOT,
+    quota_bytes=settings.WORKSPACE_QUOTA_BYTES,
+    failed_retention_seconds=settings.WORKSPACE_FAILED_RETENTION_SECONDS,
+    tmpfs_dir=settings.WORKSPACE_TMPFS_DIR,
+    tmpfs_quota_bytes=settings.WORKSPACE_TMPFS_QUOTA_BYTES,
+    resume_window_seconds=settings.RESUME_MAX_AGE_SECONDS if settings.RESUME_INTERRUPTED_JOBS else 0,
+)
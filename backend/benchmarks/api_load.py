@@ -0,0 +1,225 @@
+# backend/benchmarks/api_load.py
+"""
+Load generator for the API layer: how many concurrent submitters and pollers one replica sustains.
+
+Starts the FastAPI app under uvicorn in a subprocess with the video pipeline replaced by a no-op
+(it just sleeps for --pipeline-delay seconds), then drives a mix of POST /generate-video and
+GET /check-status calls through an async HTTP client. Runs once per status store:
+  - memory: the process-local TASK_CACHE
+  - redis:  the Redis-backed store (needs --redis-url or REDIS_URL)
+
+Usage (from the backend/ directory):
+    python -m benchmarks.api_load --submitters 10 --pollers 50 --duration 30 --stores memory redis
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SAMPLE_REQUEST = {
+    "student_name": "Load Test",
+    "topic": "Simple addition with numbers up to 10",
+    "artifacts": ["Apple", "Banana"],
+    "character_preset": "doraemon",
+    "lang": "en",
+}
+
+
+def serve(args):
+    """Server side: the real app, with the pipeline stubbed out and the chosen status store."""
+    # Settings are read at import time. The stubbed jobs get their own throwaway workspace root and
+    # nothing is resumed, so a run never picks up (or leaves behind) real jobs.
+    workspace_root = tempfile.mkdtemp(prefix="api_load_workspaces_")
+    os.environ["WORKSPACE_ROOT"] = workspace_root
+    os.environ["RESUME_INTERRUPTED_JOBS"] = "0"
+    os.environ["WORKSPACE_TMPFS_DIR"] = ""
+    sys.path.insert(0, BACKEND_DIR)
+    import uvicorn
+    from app.main import app
+    from app.api.endpoints import generator
+    from app.services import video_generator
+
+    delay = args.pipeline_delay
+
+    async def noop_pipeline(request, on_preview=None, task_id=None, **kwargs):
+        await asyncio.sleep(delay)
+        return f"https://example.invalid/{task_id}.mp4"
+
+    # The endpoint imports the pipeline lazily from this module, so patch it at the source
+    video_generator.create_personalized_video = noop_pipeline
+    if args.store == "redis":
+        import redis
+        generator.redis_client = redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        generator.redis_client = None
+        generator.TASK_CACHE.clear()
+
+    try:
+        uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+    finally:
+        shutil.rmtree(workspace_root, ignore_errors=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class OpStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.rejected = 0  # 429s from admission control: backpressure, not errors
+
+    def summary(self, duration: float) -> dict:
+        values = sorted(self.latencies)
+        total = len(values) + self.errors + self.rejected
+        return {
+            "requests": total,
+            "throughput_rps": round(len(values) / duration, 2),
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+            "max_ms": round((values[-1] if values else 0) * 1000, 2),
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+        }
+
+
+async def _drive(base_url: str, submitters: int, pollers: int, duration: float) -> dict:
+    stats = {"submit": OpStats(), "poll": OpStats()}
+    task_ids = []
+    deadline = time.perf_counter() + duration
+
+    async def timed(op: str, coro):
+        started = time.perf_counter()
+        try:
+            response = await coro
+        except httpx.HTTPError:
+            stats[op].errors += 1
+            return None
+        if response.status_code == 429:
+            stats[op].rejected += 1
+            return None
+        if response.status_code >= 400:
+            stats[op].errors += 1
+            return None
+        stats[op].latencies.append(time.perf_counter() - started)
+        return response
+
+    async def submitter(client):
+        while time.perf_counter() < deadline:
+            response = await timed("submit", client.post("/api/v1/generate-video", json=SAMPLE_REQUEST))
+            if response is not None:
+                task_ids.append(response.json()["task_id"])
+
+    async def poller(client):
+        while time.perf_counter() < deadline:
+            if not task_ids:
+                await asyncio.sleep(0.01)
+                continue
+            await timed("poll", client.get(f"/api/v1/check-status/{random.choice(task_ids)}"))
+
+    limits = httpx.Limits(max_connections=submitters + pollers, max_keepalive_connections=submitters + pollers)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[submitter(client) for _ in range(submitters)], *[poller(client) for _ in range(pollers)])
+        elapsed = time.perf_counter() - started
+
+    return {op: s.summary(elapsed) for op, s in stats.items()}
+
+
+async def _wait_until_up(base_url: str, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"API did not come up at {base_url} within {timeout}s")
+
+
+def run_store(store: str, args) -> dict:
+    port = _free_port()
+    command = [sys.executable, "-m", "benchmarks.api_load", "--serve", "--store", store, "--port", str(port),
+               "--pipeline-delay", str(args.pipeline_delay)]
+    if args.redis_url:
+        command += ["--redis-url", args.redis_url]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(_wait_until_up(base_url))
+        print(f"[Load] store={store}: {args.submitters} submitters + {args.pollers} pollers for {args.duration}s")
+        results = asyncio.run(_drive(base_url, args.submitters, args.pollers, args.duration))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    for op, summary in results.items():
+        print(f"[Load]   {op:6s} {summary['throughput_rps']:8.1f} req/s  p50={summary['p50_ms']}ms  "
+              f"p99={summary['p99_ms']}ms  errors={summary['errors']} ({summary['error_rate']:.2%})  rejected={summary['rejected']}")
+    return {"store": store, **results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /generate-video and /check-status against a no-op pipeline.")
+    parser.add_argument("--submitters", type=int, default=10, help="Concurrent clients posting /generate-video.")
+    parser.add_argument("--pollers", type=int, default=50, help="Concurrent clients polling /check-status.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run each store.")
+    parser.add_argument("--pipeline-delay", type=float, default=0.5, help="Seconds the stubbed pipeline takes per job.")
+    parser.add_argument("--stores", nargs="+", default=["memory", "redis"], choices=["memory", "redis"])
+    parser.add_argument("--redis-url", default=os.environ.get("REDIS_URL"))
+    parser.add_argument("--output", default="api_load_results.json", help="Where to write the JSON report.")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--store", default="memory", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    results = []
+    for store in args.stores:
+        if store == "redis" and not args.redis_url:
+            print("[Load] Skipping redis: pass --redis-url or set REDIS_URL.")
+            continue
+        results.append(run_store(store, args))
+
+    report = {
+        "benchmark": "api_load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {"submitters": args.submitters, "pollers": args.pollers, "duration": args.duration,
+                   "pipeline_delay": args.pipeline_delay},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[Load] Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
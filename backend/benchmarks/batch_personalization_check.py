@@ -0,0 +1,124 @@
+# backend/benchmarks/batch_personalization_check.py
+"""
+Regression check for classroom batches: which scenes get rendered per student.
+
+Runs `batch_generator.classify_scenes` on small hand-written master scripts and fails (exit code 1)
+if a scene that shows the student's name would be rendered once for the whole class, or a scene
+that doesn't would be wrongly rendered per student.
+
+Usage (from the backend/ directory), e.g. in CI:
+    python -m benchmarks.batch_personalization_check
+"""
+import sys
+
+from app.services.batch_generator import classify_scenes
+from app.services.video_generator import STUDENT_NAME_PLACEHOLDER as NAME
+
+STORYBOARD = [
+    {"scene_number": n, "scene_description": f"Scene {n}", "narration": f"Narration {n}"}
+    for n in (1, 2, 3)
+]
+
+CASES = [
+    (
+        "name only inside one scene class",
+        f'''
+from manim import *
+
+class Scene1(Scene):
+    def construct(self):
+        self.play(Write(Text("Hi {NAME}")))
+
+class Scene2(Scene):
+    def construct(self):
+        self.play(Write(Text("2 + 2 = 4")))
+
+class Scene3(Scene):
+    def construct(self):
+        self.play(Write(Text("Done")))
+''',
+        {1: True, 2: False, 3: False},
+    ),
+    (
+        "name in a helper function defined between scenes",
+        f'''
+from manim import *
+
+class Scene1(Scene):
+    def construct(self):
+        self.play(Write(Text("Apples")))
+
+class Scene2(Scene):
+    def construct(self):
+        self.play(Write(Text("2 + 2 = 4")))
+
+def helper():
+    return Text("Bye {NAME}")
+
+class Scene3(Scene):
+    def construct(self):
+        self.play(Write(helper()))
+''',
+        {1: True, 2: True, 3: True},
+    ),
+    (
+        "name in a module-level constant",
+        f'''
+from manim import *
+
+GREETING = "Hello {NAME}"
+
+class Scene1(Scene):
+    def construct(self):
+        self.play(Write(Text(GREETING)))
+
+class Scene2(Scene):
+    def construct(self):
+        self.play(Write(Text("2 + 2 = 4")))
+
+class Scene3(Scene):
+    def construct(self):
+        self.play(Write(Text("Done")))
+''',
+        {1: True, 2: True, 3: True},
+    ),
+    (
+        "name-free helper after a scene doesn't leak into it",
+        f'''
+from manim import *
+
+class Scene1(Scene):
+    def construct(self):
+        self.play(Write(Text("Hi {NAME}")))
+
+class Scene2(Scene):
+    def construct(self):
+        self.play(Write(label()))
+
+def label():
+    return Text("2 + 2 = 4")
+
+class Scene3(Scene):
+    def construct(self):
+        self.play(Write(Text("Done")))
+''',
+        {1: True, 2: False, 3: False},
+    ),
+]
+
+
+def main() -> int:
+    failed = False
+    for name, script, expected in CASES:
+        personalization = classify_scenes(STORYBOARD, script)
+        got = {scene_num: video_personal for scene_num, (video_personal, _) in personalization.items()}
+        if got == expected:
+            print(f"[Check] OK   {name}")
+        else:
+            print(f"[Check] FAIL {name}: expected per-student videos {expected}, got {got}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
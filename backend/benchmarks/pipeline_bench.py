@@ -0,0 +1,261 @@
+# backend/benchmarks/pipeline_bench.py
+"""
+Offline end-to-end benchmark for create_personalized_video.
+
+Runs the real pipeline (Manim, ffmpeg, MoviePy, workspace handling) with the paid/remote providers
+swapped out:
+  - Gemini      -> a canned storyboard and a canned master Manim script
+  - ElevenLabs  -> a synthetic sine tone sized to the narration (still goes through the atempo step)
+  - R2          -> a local directory, or any S3-compatible endpoint passed with --s3-endpoint (e.g. MinIO)
+
+Each (scenes, concurrent jobs) point runs in a fresh subprocess so CPU time, peak RSS and disk
+counters belong to that point alone. Results are written as JSON so runs can be diffed across commits.
+
+Usage (from the backend/ directory):
+    python -m benchmarks.pipeline_bench --scenes 1 5 15 --jobs 1 2 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+BACKGROUNDS = [f"assets/backgrounds/bg{i}.png" for i in range(1, 6)]
+ARTIFACTS = ["assets/apple.png", "assets/banana.png", "assets/mango.png", "assets/carrot.png", "assets/tomato.png"]
+
+
+def canned_storyboard(num_scenes: int, student_name: str) -> list:
+    return [
+        {
+            "scene_number": n,
+            "scene_description": f"Doraemon counts {n} apples with {student_name}. Use background bg{(n - 1) % 5 + 1}.png.",
+            "narration": f"Hello {student_name}... let's count together... this is step {n} of our adventure with apples and bananas!",
+        }
+        for n in range(1, num_scenes + 1)
+    ]
+
+
+def canned_master_script(num_scenes: int) -> str:
+    """A deterministic script in the same shape the Manim prompt asks Gemini for."""
+    parts = ["from manim import *\n\nscene_state = {}\n"]
+    for n in range(1, num_scenes + 1):
+        parts.append(f'''
+class Scene{n}(Scene):
+    def construct(self):
+        bg = ImageMobject("{BACKGROUNDS[(n - 1) % len(BACKGROUNDS)]}")
+        bg.scale_to_fit_height(self.camera.frame_height)
+        self.add(bg)
+        host = ImageMobject("assets/doraemon.png").scale(0.8).to_corner(DL)
+        item = ImageMobject("{ARTIFACTS[(n - 1) % len(ARTIFACTS)]}").scale(0.5).to_corner(UR)
+        title = Text("Step {n}", font_size=72, color="#C71585").move_to(ORIGIN)
+        self.play(FadeIn(host), Write(title), run_time=1.5)
+        self.play(FadeIn(item), run_time=1)
+        self.wait(0.5)
+''')
+    return "".join(parts)
+
+
+class LocalS3Client:
+    """Just enough of boto3's S3 client for upload_video_to_r2: copies objects into a directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        destination = os.path.join(self.root, Bucket, Key)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(Filename, destination)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _io_write_bytes() -> int:
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def install_stubs(num_scenes: int, bucket_dir: str, s3_endpoint: str = None):
+    """Monkeypatches the provider calls. Must run before the pipeline starts."""
+    from app.core.config import settings
+    from app.services import video_generator, tts_generator, storage_service
+
+    async def fake_storyboard(request):
+        return canned_storyboard(num_scenes, request.student_name)
+
+    async def fake_manim_script(scene_description, output_dir):
+        script_path = os.path.join(output_dir, "master_script_bench.py")
+        with open(script_path, "w") as f:
+            f.write(canned_master_script(num_scenes))
+        return script_path
+
+    def fake_tts(narration, final_output_path, lang):
+        # Roughly the pace of the real voice: ~15 characters per second
+        duration = max(1.0, len(narration) / 15)
+        raw_path = f"{final_output_path}.raw.mp3"
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration:.2f}",
+             "-c:a", "libmp3lame", "-b:a", "128k", raw_path],
+            check=True,
+        )
+        tts_generator._speed_adjust_audio(raw_path, final_output_path, speed_factor=0.90)
+        os.remove(raw_path)
+        return final_output_path
+
+    video_generator.generate_video_storyboard = fake_storyboard
+    video_generator.generate_manim_script = fake_manim_script
+    tts_generator._blocking_elevenlabs_tts = fake_tts
+
+    settings.R2_BUCKET_NAME = settings.R2_BUCKET_NAME or "mathtoons-bench"
+    settings.R2_PUBLIC_URL_BASE = f"file://{bucket_dir}"
+    if s3_endpoint:
+        settings.R2_ENDPOINT_URL = s3_endpoint
+        settings.R2_ACCESS_KEY_ID = os.environ.get("BENCH_S3_ACCESS_KEY", "minioadmin")
+        settings.R2_SECRET_ACCESS_KEY = os.environ.get("BENCH_S3_SECRET_KEY", "minioadmin")
+    else:
+        storage_service.get_r2_client = lambda: LocalS3Client(bucket_dir)
+
+
+async def _run_point(num_scenes: int, num_jobs: int, quality: str) -> dict:
+    from app.core import tracing
+    from app.models.video import VideoGenerationRequest
+    from app.services.video_generator import create_personalized_video
+    from app.services.workspace import workspace_manager
+
+    # Measure each workspace just before it is cleaned up
+    workspace_bytes = []
+    original_release = workspace_manager.release
+
+    def measuring_release(task_id, success):
+        ws = workspace_manager._workspaces.get(task_id)
+        if ws is not None:
+            workspace_bytes.append(workspace_manager._workspace_size(ws))
+        original_release(task_id, success)
+
+    workspace_manager.release = measuring_release
+
+    requests = [
+        VideoGenerationRequest(student_name=f"Bench Student {i}", topic="Counting to 10", artifacts=["Apple", "Banana"],
+                               character_preset="doraemon", lang="en", quality=quality)
+        for i in range(num_jobs)
+    ]
+    task_ids = [f"bench_{num_scenes}s_{num_jobs}j_{i}" for i in range(num_jobs)]
+
+    usage_before = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+    io_before = _io_write_bytes()
+    started = time.perf_counter()
+    urls = await asyncio.gather(*(create_personalized_video(r, task_id=t) for r, t in zip(requests, task_ids)))
+    wall = time.perf_counter() - started
+    self_after, children_after = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    self_before, children_before = usage_before
+
+    stages = {}
+    for task_id in task_ids:
+        trace = tracing.get_trace(task_id)
+        for stage, seconds in (trace.stage_totals() if trace else {}).items():
+            stages.setdefault(stage, []).append(seconds)
+
+    return {
+        "scenes": num_scenes,
+        "jobs": num_jobs,
+        "quality": quality,
+        "failed_jobs": sum(1 for url in urls if not url),
+        "wall_seconds": round(wall, 3),
+        # Mean seconds per job spent in each stage (scene-level stages are summed across scenes)
+        "stage_seconds": {stage: round(sum(v) / len(v), 3) for stage, v in sorted(stages.items())},
+        "cpu_user_seconds": round((self_after.ru_utime - self_before.ru_utime) + (children_after.ru_utime - children_before.ru_utime), 3),
+        "cpu_system_seconds": round((self_after.ru_stime - self_before.ru_stime) + (children_after.ru_stime - children_before.ru_stime), 3),
+        # ru_maxrss is in KiB on Linux; children is the largest single child (manim/ffmpeg), not a sum
+        "peak_rss_mb": round(self_after.ru_maxrss / 1024, 1),
+        "children_peak_rss_mb": round(children_after.ru_maxrss / 1024, 1),
+        "disk_bytes_written": _io_write_bytes() - io_before + (children_after.ru_oublock - children_before.ru_oublock) * 512,
+        "workspace_peak_bytes": sum(workspace_bytes),
+    }
+
+
+def run_worker(args) -> dict:
+    """Runs one sweep point in this process and prints its result as JSON."""
+    scratch = tempfile.mkdtemp(prefix="mathtoons_bench_")
+    os.environ["WORKSPACE_ROOT"] = os.path.join(scratch, "workspaces")
+    os.environ["WORKSPACE_FAILED_RETENTION_SECONDS"] = "0"
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    try:
+        install_stubs(args.scenes[0], os.path.join(scratch, "bucket"), args.s3_endpoint)
+        result = asyncio.run(_run_point(args.scenes[0], args.jobs[0], args.quality))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    print("BENCH_RESULT " + json.dumps(result))
+    return result
+
+
+def run_sweep(args):
+    results = []
+    for num_scenes in args.scenes:
+        for num_jobs in args.jobs:
+            for repeat in range(args.repeat):
+                print(f"[Bench] scenes={num_scenes} jobs={num_jobs} quality={args.quality} run={repeat + 1}/{args.repeat}")
+                command = [sys.executable, "-m", "benchmarks.pipeline_bench", "--worker",
+                           "--scenes", str(num_scenes), "--jobs", str(num_jobs), "--quality", args.quality]
+                if args.s3_endpoint:
+                    command += ["--s3-endpoint", args.s3_endpoint]
+                proc = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True)
+                lines = [l for l in proc.stdout.splitlines() if l.startswith("BENCH_RESULT ")]
+                if proc.returncode != 0 or not lines:
+                    print(f"[Bench] !!! Point failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+                    results.append({"scenes": num_scenes, "jobs": num_jobs, "quality": args.quality, "error": proc.stderr[-2000:]})
+                    continue
+                result = json.loads(lines[-1][len("BENCH_RESULT "):])
+                print(f"[Bench]   wall={result['wall_seconds']}s cpu={result['cpu_user_seconds'] + result['cpu_system_seconds']:.1f}s "
+                      f"rss={result['peak_rss_mb']}MB failed={result['failed_jobs']}")
+                results.append(result)
+
+    report = {
+        "benchmark": "pipeline",
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[Bench] Wrote {len(results)} results to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the video pipeline.")
+    parser.add_argument("--scenes", type=int, nargs="+", default=[1, 5, 15], help="Scene counts to sweep.")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4], help="Concurrent job counts to sweep.")
+    parser.add_argument("--quality", default="standard", choices=["preview", "standard", "final"])
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per sweep point.")
+    parser.add_argument("--s3-endpoint", default=None, help="Upload to this S3-compatible endpoint instead of a local directory.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON report.")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+    else:
+        run_sweep(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# backend/benchmarks/startup_budget.py
+"""
+Import-time budget check for the API process.
+
+Imports `app.main` in fresh interpreters and fails (exit code 1) if:
+  - the median import time goes over the budget, or
+  - any render-only dependency (Gemini SDK, ElevenLabs, MoviePy, Manim, Playwright, ...) gets
+    pulled in. Those belong on the worker path and are imported lazily there.
+
+Usage (from the backend/ directory), e.g. in CI:
+    python -m benchmarks.startup_budget --budget 1.5 --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULT_BUDGET_SECONDS = float(os.environ.get("API_STARTUP_BUDGET_SECONDS", "1.5"))
+
+# Top-level packages the API must not import just to serve requests
+WORKER_ONLY_MODULES = [
+    "google.generativeai",
+    "grpc",
+    "elevenlabs",
+    "moviepy",
+    "manim",
+    "playwright",
+    "boto3",
+    "ffmpeg",
+]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print("STARTUP_PROBE " + json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def probe_once() -> dict:
+    proc = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, capture_output=True, text=True)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith("STARTUP_PROBE ")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"Importing app.main failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return json.loads(lines[-1][len("STARTUP_PROBE "):])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fail if importing the API takes too long or loads worker-only dependencies.")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="Maximum median import time in seconds.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to sample.")
+    args = parser.parse_args()
+
+    samples = [probe_once() for _ in range(args.runs)]
+    timings = [s["seconds"] for s in samples]
+    median = statistics.median(timings)
+    loaded = set(samples[-1]["modules"])
+    leaked = [m for m in WORKER_ONLY_MODULES if m in loaded]
+
+    print(f"[Startup] import app.main: median={median:.3f}s min={min(timings):.3f}s max={max(timings):.3f}s (budget {args.budget:.3f}s)")
+    failed = False
+    if median > args.budget:
+        print(f"[Startup] !!! FAIL: median import time {median:.3f}s is over the {args.budget:.3f}s budget.")
+        failed = True
+    if leaked:
+        print(f"[Startup] !!! FAIL: worker-only modules imported by the API: {', '.join(leaked)}")
+        failed = True
+    if not failed:
+        print("[Startup] OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())